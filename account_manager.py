@@ -3,11 +3,18 @@ Account Manager Module
 ======================
 Manages Modal accounts: add, remove, switch, track balances.
 Uses SQLite database for encrypted storage.
+
+Getters return sqlite3.Row objects, which support access by column name
+(row['username']) and by index. Rows have no .get(); columns are always present.
 """
 
 import sqlite3
 import logging
-from typing import Optional, List, Dict, Any
+import threading
+import atexit
+import weakref
+from collections import deque
+from typing import Optional, List, Dict, Any, Iterator
 from datetime import datetime
 from pathlib import Path
 import config
@@ -15,24 +22,31 @@ import utils
 
 logger = logging.getLogger(__name__)
 
+def _to_cents(amount: float) -> int:
+    """Convert a dollar amount to integer cents."""
+    return int(round(amount * 100))
+
 # ============================================================================
 # DATABASE SCHEMA
 # ============================================================================
 
+# New accounts start at config.INITIAL_BALANCE in both balance columns
 CREATE_ACCOUNTS_TABLE = """
 CREATE TABLE IF NOT EXISTS accounts (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT UNIQUE NOT NULL,
     token_id_encrypted TEXT NOT NULL,
     token_secret_encrypted TEXT NOT NULL,
-    balance REAL DEFAULT 80.0,
+    balance REAL DEFAULT {balance},
+    balance_cents INTEGER DEFAULT {balance_cents},
     status TEXT DEFAULT 'ready',
     is_active INTEGER DEFAULT 0,
     selected_gpu TEXT DEFAULT NULL,
+    switch_at REAL DEFAULT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 )
-"""
+""".format(balance=float(config.INITIAL_BALANCE), balance_cents=_to_cents(config.INITIAL_BALANCE))
 
 CREATE_USAGE_LOG_TABLE = """
 CREATE TABLE IF NOT EXISTS usage_log (
@@ -45,10 +59,165 @@ CREATE TABLE IF NOT EXISTS usage_log (
 )
 """
 
+# Balances are stored as integer cents for exact arithmetic and cheap index
+# compares. The REAL `balance` column is kept in step for existing readers.
+MIGRATE_ADD_BALANCE_CENTS = "ALTER TABLE accounts ADD COLUMN balance_cents INTEGER"
+MIGRATE_BACKFILL_BALANCE_CENTS = """
+UPDATE accounts SET balance_cents = CAST(ROUND(balance * 100) AS INTEGER)
+WHERE balance_cents IS NULL
+"""
+
+# Pending auto-switch deadline (epoch seconds), persisted so it survives restarts
+MIGRATE_ADD_SWITCH_AT = "ALTER TABLE accounts ADD COLUMN switch_at REAL"
+
+# Indexes superseded by idx_available_cents, dropped once from older databases
+MIGRATE_DROP_OBSOLETE_INDEXES = {
+    'idx_accounts_pick': "DROP INDEX idx_accounts_pick",
+    'idx_available': "DROP INDEX idx_available",
+}
+
+CREATE_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_accounts_active ON accounts(is_active) WHERE is_active = 1;
+CREATE INDEX IF NOT EXISTS idx_available_cents ON accounts(balance_cents DESC, status, id) WHERE is_active = 0 AND status != 'dead';
+CREATE INDEX IF NOT EXISTS idx_log_account_ts ON usage_log(account_id, timestamp DESC);
+"""
+
+# Stamp updated_at on every change. The WHEN clause skips rows whose UPDATE
+# already set updated_at, and recursive triggers are off by default.
+CREATE_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS accounts_touch
+AFTER UPDATE ON accounts
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE accounts SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;
+"""
+
+# Connection tuning applied once at startup: WAL lets readers run alongside
+# a writer, and synchronous=NORMAL is safe under WAL (no fsync per commit).
+# Foreign keys stay unenforced: usage_log keeps the history of removed accounts.
+DATABASE_PRAGMAS = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+PRAGMA temp_store = MEMORY;
+PRAGMA cache_size = -16000;
+PRAGMA mmap_size = 268435456;
+"""
+
+# Per-thread read connections refuse writes and share the same cache tuning
+READ_CONNECTION_PRAGMAS = """
+PRAGMA query_only = ON;
+PRAGMA temp_store = MEMORY;
+PRAGMA cache_size = -16000;
+PRAGMA mmap_size = 268435456;
+"""
+
+# Size of the per-connection prepared-statement LRU (sqlite3 `cached_statements`).
+# The stdlib driver cannot pass SQLITE_PREPARE_PERSISTENT, but with fewer
+# distinct queries than cache slots every statement below is prepared once and
+# then lives for the lifetime of the single shared connection.
+STATEMENT_CACHE_SIZE = 128
+
+# Usage log rows are queued and written in batches by a background thread
+LOG_FLUSH_INTERVAL = 0.5   # seconds between flushes
+LOG_BATCH_SIZE = 64        # flush early once this many rows are queued
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+# The sqlite3 statement cache is keyed on the exact SQL text, so every query
+# lives here as a constant and is passed by name. Never build these with
+# f-strings or string concatenation - a byte-different string is a cache miss.
+
+SQL_GET_BY_USERNAME = "SELECT * FROM accounts WHERE username = ?"
+SQL_GET_BY_ID = "SELECT * FROM accounts WHERE id = ?"
+SQL_GET_ALL = "SELECT * FROM accounts ORDER BY created_at ASC"
+SQL_GET_ACTIVE = "SELECT * FROM accounts WHERE is_active = 1 LIMIT 1"
+SQL_GET_BY_STATUS = "SELECT * FROM accounts WHERE status = ?"
+SQL_STATS = "SELECT COUNT(*), COALESCE(SUM(balance_cents), 0) FROM accounts"
+SQL_COUNT_AND_EXISTS = "SELECT COUNT(*), COALESCE(SUM(username = ?), 0) FROM accounts"
+SQL_GET_CREDS = "SELECT token_id_encrypted, token_secret_encrypted FROM accounts WHERE username = ?"
+SQL_GET_BALANCE = "SELECT balance_cents FROM accounts WHERE username = ?"
+SQL_GET_SWITCH_DEADLINES = "SELECT username, switch_at FROM accounts WHERE switch_at IS NOT NULL"
+
+SQL_INSERT_ACCOUNT = """
+INSERT INTO accounts (username, token_id_encrypted, token_secret_encrypted, balance, balance_cents, status)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+SQL_INSERT_ACCOUNT_RETURNING = """
+INSERT INTO accounts (username, token_id_encrypted, token_secret_encrypted, balance, balance_cents, status)
+VALUES (?, ?, ?, ?, ?, ?)
+RETURNING id
+"""
+
+# INSERT ... RETURNING needs SQLite 3.35+; older libraries fall back to lastrowid
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+SQL_GET_IS_ACTIVE = "SELECT is_active FROM accounts WHERE username = ?"
+SQL_DELETE_INACTIVE_ACCOUNT = "DELETE FROM accounts WHERE username = ? AND is_active = 0"
+SQL_DELETE_INACTIVE_ACCOUNT_RETURNING = "DELETE FROM accounts WHERE username = ? AND is_active = 0 RETURNING balance_cents"
+
+# updated_at is maintained by the accounts_touch trigger, not by each UPDATE
+SQL_UPDATE_BALANCE = "UPDATE accounts SET balance = ?, balance_cents = ? WHERE username = ?"
+SQL_UPDATE_STATUS = "UPDATE accounts SET status = ? WHERE username = ?"
+SQL_UPDATE_GPU = "UPDATE accounts SET selected_gpu = ? WHERE username = ?"
+SQL_UPDATE_SWITCH_AT = "UPDATE accounts SET switch_at = ? WHERE username = ?"
+SQL_DEACTIVATE_ALL = "UPDATE accounts SET is_active = 0 WHERE is_active = 1"
+SQL_ACTIVATE = "UPDATE accounts SET is_active = 1 WHERE username = ?"
+
+# Columns that _update_column may write, mapped to their fixed statements
+UPDATABLE_COLUMNS = {
+    'status': SQL_UPDATE_STATUS,
+    'selected_gpu': SQL_UPDATE_GPU,
+    'switch_at': SQL_UPDATE_SWITCH_AT,
+}
+
+# Filter matches the idx_available_cents partial index exactly, so SQLite walks the
+# index in balance order and stops at the first row - no sort, no scan
+SQL_NEXT_AVAILABLE = """
+SELECT id, username, token_id_encrypted, token_secret_encrypted, balance, status, selected_gpu
+FROM accounts 
+WHERE is_active = 0 
+AND status != 'dead'
+AND balance_cents >= ? 
+ORDER BY balance_cents DESC
+LIMIT 1
+"""
+
+# Existence check over the same partial index; returns a single constant column
+SQL_EXISTS_AVAILABLE = """
+SELECT 1 FROM accounts 
+WHERE is_active = 0 
+AND status != 'dead'
+AND balance_cents >= ? 
+LIMIT 1
+"""
+
+SQL_INSERT_LOG = """
+INSERT INTO usage_log (account_id, action, details)
+VALUES (?, ?, ?)
+"""
+SQL_INSERT_LOG_FOR_USERNAME = """
+INSERT INTO usage_log (account_id, action, details)
+SELECT id, ?, ? FROM accounts WHERE username = ?
+"""
+SQL_GET_HISTORY = """
+SELECT * FROM usage_log 
+WHERE account_id = ? 
+ORDER BY timestamp DESC 
+LIMIT ?
+"""
+
 # ============================================================================
 # ACCOUNT MANAGER CLASS
 # ============================================================================
 
+class _ReadConnection:
+    """Holds one thread's read connection; it is closed when the thread goes away."""
+    __slots__ = ('conn', '__weakref__')
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
 class AccountManager:
     """Manages Modal accounts and their credentials."""
     
@@ -58,27 +227,159 @@ class AccountManager:
             db_path = config.DATABASE_FILE
         
         self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None  # Single shared writer
+        self._lock = threading.RLock()  # Serializes access to the writer connection
+        self._tls = threading.local()  # Per-thread read-only connections
+        self._read_finalizers: List[weakref.finalize] = []
+        self._read_finalizers_lock = threading.Lock()  # Readers open connections from many threads
         self._init_database()
+        
+        # In-memory aggregates, kept in step by the mutators (guarded by _lock)
+        self._count = 0
+        self._total_cents = 0
+        self._load_stats()
+        
+        # Cached active account row; writers call invalidate_active() and bump
+        # the generation so a read racing a write never stores a stale row
+        self._active_cache: Optional[sqlite3.Row] = None
+        self._active_cached = False
+        self._active_generation = 0
+        
+        # Decrypted tokens by username; tokens never change after add_account,
+        # so entries are only dropped when the account is removed
+        self._cred_cache: Dict[str, Dict[str, str]] = {}
+        
+        # Batched usage logging
+        self._log_queue = deque()
+        self._log_lock = threading.Lock()
+        self._log_wakeup = threading.Event()
+        self._log_stop = threading.Event()
+        self._log_thread = threading.Thread(
+            target=self._log_flush_loop,
+            name="usage-log-flusher",
+            daemon=True
+        )
+        self._log_thread.start()
+        atexit.register(self.close)
     
     def _init_database(self):
-        """Initialize database tables."""
+        """Open the shared database connection and create tables."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(CREATE_ACCOUNTS_TABLE)
-            cursor.execute(CREATE_USAGE_LOG_TABLE)
-            conn.commit()
-            conn.close()
-            logger.info(f"Database initialized: {self.db_path}")
+            # One long-lived connection for the whole process. Autocommit mode
+            # (isolation_level=None); multi-statement writes use explicit BEGIN.
+            self._conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                isolation_level=None,
+                cached_statements=STATEMENT_CACHE_SIZE
+            )
+            self._conn.row_factory = sqlite3.Row  # Enable column access by name
+            
+            with self._lock:
+                conn = self._conn
+                conn.executescript(DATABASE_PRAGMAS)
+                
+                journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+                if journal_mode.lower() != 'wal':
+                    logger.warning("WAL mode unavailable, using journal_mode=%s", journal_mode)
+                
+                conn.execute(CREATE_ACCOUNTS_TABLE)
+                conn.execute(CREATE_USAGE_LOG_TABLE)
+                self._migrate_balance_cents(conn)
+                self._migrate_switch_at(conn)
+                self._migrate_drop_obsolete_indexes(conn)
+                conn.executescript(CREATE_INDEXES)
+                conn.executescript(CREATE_TRIGGERS)
+                
+                # Gather planner statistics once for a fresh database
+                has_stats = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+                ).fetchone()
+                if not has_stats:
+                    conn.execute("ANALYZE")
+            logger.info("Database initialized: %s", self.db_path)
         except Exception as e:
-            logger.error(f"Failed to initialize database: {e}")
+            logger.error("Failed to initialize database: %s", e)
+            raise
+    
+    def _migrate_balance_cents(self, conn: sqlite3.Connection):
+        """Add and backfill the balance_cents column on older databases."""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(accounts)")}
+        if 'balance_cents' in columns:
+            return
+        
+        conn.execute("BEGIN")
+        try:
+            conn.execute(MIGRATE_ADD_BALANCE_CENTS)
+            conn.execute(MIGRATE_BACKFILL_BALANCE_CENTS)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
             raise
+        logger.info("Migrated account balances to integer cents")
+    
+    def _migrate_switch_at(self, conn: sqlite3.Connection):
+        """Add the switch_at deadline column on older databases."""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(accounts)")}
+        if 'switch_at' not in columns:
+            conn.execute(MIGRATE_ADD_SWITCH_AT)
+    
+    def _migrate_drop_obsolete_indexes(self, conn: sqlite3.Connection):
+        """Drop indexes left behind by earlier schema versions."""
+        existing = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        for name, sql in MIGRATE_DROP_OBSOLETE_INDEXES.items():
+            if name in existing:
+                conn.execute(sql)
+                logger.info("Dropped obsolete index %s", name)
+    
+    def _load_stats(self):
+        """Load the account count and total balance from the database."""
+        with self._lock:
+            conn = self._get_connection()
+            self._count, self._total_cents = conn.execute(SQL_STATS).fetchone()
     
     def _get_connection(self) -> sqlite3.Connection:
-        """Get database connection."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable column access by name
-        return conn
+        """Get the shared writer connection (callers must hold self._lock)."""
+        return self._conn
+    
+    def _get_read_connection(self) -> sqlite3.Connection:
+        """Get this thread's read-only connection, opening it on first use."""
+        holder = getattr(self._tls, 'read_conn', None)
+        if holder is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                isolation_level=None,
+                cached_statements=STATEMENT_CACHE_SIZE
+            )
+            conn.row_factory = sqlite3.Row
+            conn.executescript(READ_CONNECTION_PRAGMAS)
+            
+            holder = _ReadConnection(conn)
+            with self._read_finalizers_lock:
+                self._read_finalizers = [f for f in self._read_finalizers if f.alive]
+                self._read_finalizers.append(weakref.finalize(holder, conn.close))
+            self._tls.read_conn = holder
+        return holder.conn
+    
+    def close(self):
+        """Flush pending usage logs and close the shared database connection."""
+        self._log_stop.set()
+        self._log_wakeup.set()
+        if self._log_thread.is_alive() and self._log_thread is not threading.current_thread():
+            self._log_thread.join()
+        self._flush_log_queue()
+        
+        with self._read_finalizers_lock:
+            finalizers, self._read_finalizers = self._read_finalizers, []
+        for finalizer in finalizers:
+            finalizer()
+        self._tls = threading.local()
+        
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
     
     # ========================================================================
     # ADD / REMOVE ACCOUNTS
@@ -106,12 +407,19 @@ class AccountManager:
         if not valid:
             return False, error
         
-        # Check account limit
-        if self.get_account_count() >= config.MAX_ACCOUNTS:
+        # Check account limit and existing username in one query
+        try:
+            with self._lock:
+                conn = self._get_connection()
+                count, exists = conn.execute(SQL_COUNT_AND_EXISTS, (username,)).fetchone()
+        except Exception as e:
+            logger.error("Failed to check accounts before adding '%s': %s", username, e)
+            return False, f"Database error: {str(e)}"
+        
+        if count >= config.MAX_ACCOUNTS:
             return False, f"Maximum account limit reached ({config.MAX_ACCOUNTS} accounts)"
         
-        # Check if username already exists
-        if self.get_account_by_username(username):
+        if exists:
             return False, f"Account '{username}' already exists"
         
         try:
@@ -119,27 +427,40 @@ class AccountManager:
             token_id_encrypted = utils.encrypt_data(token_id)
             token_secret_encrypted = utils.encrypt_data(token_secret)
             
-            # Insert into database
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO accounts (username, token_id_encrypted, token_secret_encrypted, balance, status)
-                VALUES (?, ?, ?, ?, ?)
-            """, (username, token_id_encrypted, token_secret_encrypted, config.INITIAL_BALANCE, 'ready'))
-            
-            account_id = cursor.lastrowid
+            with self._lock:
+                conn = self._get_connection()
+                conn.execute("BEGIN")
+                try:
+                    # Insert into database
+                    params = (
+                        username, token_id_encrypted, token_secret_encrypted,
+                        config.INITIAL_BALANCE, _to_cents(config.INITIAL_BALANCE), 'ready'
+                    )
+                    if SQLITE_HAS_RETURNING:
+                        account_id = conn.execute(SQL_INSERT_ACCOUNT_RETURNING, params).fetchone()[0]
+                    else:
+                        cursor = conn.execute(SQL_INSERT_ACCOUNT, params)
+                        account_id = cursor.lastrowid
+                    
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                
+                self._count += 1
+                self._total_cents += _to_cents(config.INITIAL_BALANCE)
             
             # Log the action
             self._log_action(account_id, 'account_added', 'New account created')
             
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Account '{username}' added successfully")
+            logger.info("Account '%s' added successfully", username)
             return True, f"Account '{username}' added successfully!"
             
+        except sqlite3.IntegrityError:
+            # UNIQUE(username) caught a concurrent add of the same account
+            return False, f"Account '{username}' already exists"
         except Exception as e:
-            logger.error(f"Failed to add account '{username}': {e}")
+            logger.error("Failed to add account '%s': %s", username, e)
             return False, f"Database error: {str(e)}"
     
     def remove_account(self, username: str) -> tuple[bool, str]:
@@ -152,115 +473,118 @@ class AccountManager:
         Returns:
             (success, message)
         """
-        account = self.get_account_by_username(username)
-        if not account:
-            return False, f"Account '{username}' not found"
-        
-        # Don't allow removing active account
-        if account['is_active']:
-            return False, f"Cannot remove active account. Switch to another account first."
-        
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Log before deletion
-            self._log_action(account['id'], 'account_removed', 'Account deleted')
-            
-            # Delete account
-            cursor.execute("DELETE FROM accounts WHERE username = ?", (username,))
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Account '{username}' removed successfully")
+            with self._lock:
+                conn = self._get_connection()
+                conn.execute("BEGIN")
+                try:
+                    # Audit the removal; rolled back with the delete if nothing is removed
+                    conn.execute(SQL_INSERT_LOG_FOR_USERNAME, ('account_removed', 'Account deleted', username))
+                    
+                    # Delete account - the active account never matches
+                    if SQLITE_HAS_RETURNING:
+                        deleted = conn.execute(SQL_DELETE_INACTIVE_ACCOUNT_RETURNING, (username,)).fetchone()
+                    else:
+                        cursor = conn.execute(SQL_DELETE_INACTIVE_ACCOUNT, (username,))
+                        deleted = cursor.rowcount > 0
+                    
+                    if not deleted:
+                        conn.execute("ROLLBACK")
+                        
+                        # Nothing removed: work out why
+                        if conn.execute(SQL_GET_IS_ACTIVE, (username,)).fetchone() is None:
+                            return False, f"Account '{username}' not found"
+                        return False, f"Cannot remove active account. Switch to another account first."
+                    
+                    conn.execute("COMMIT")
+                except Exception:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+                
+                self._cred_cache.pop(username, None)
+                
+                if SQLITE_HAS_RETURNING:
+                    self._count -= 1
+                    self._total_cents -= deleted['balance_cents']
+                else:
+                    self._load_stats()
+            
+            logger.info("Account '%s' removed successfully", username)
             return True, f"Account '{username}' removed successfully!"
             
         except Exception as e:
-            logger.error(f"Failed to remove account '{username}': {e}")
+            logger.error("Failed to remove account '%s': %s", username, e)
             return False, f"Database error: {str(e)}"
     
     # ========================================================================
     # GET ACCOUNTS
     # ========================================================================
     
-    def get_account_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+    def get_account_by_username(self, username: str) -> Optional[sqlite3.Row]:
         """Get account by username."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM accounts WHERE username = ?", (username,))
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
-                return dict(row)
-            return None
+            conn = self._get_read_connection()
+            return conn.execute(SQL_GET_BY_USERNAME, (username,)).fetchone()
             
         except Exception as e:
-            logger.error(f"Failed to get account '{username}': {e}")
+            logger.error("Failed to get account '%s': %s", username, e)
             return None
     
-    def get_account_by_id(self, account_id: int) -> Optional[Dict[str, Any]]:
+    def get_account_by_id(self, account_id: int) -> Optional[sqlite3.Row]:
         """Get account by ID."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM accounts WHERE id = ?", (account_id,))
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
-                return dict(row)
-            return None
+            conn = self._get_read_connection()
+            return conn.execute(SQL_GET_BY_ID, (account_id,)).fetchone()
             
         except Exception as e:
-            logger.error(f"Failed to get account ID {account_id}: {e}")
+            logger.error("Failed to get account ID %s: %s", account_id, e)
             return None
     
-    def get_all_accounts(self) -> List[Dict[str, Any]]:
+    def iter_all_accounts(self) -> Iterator[sqlite3.Row]:
+        """Iterate over all accounts, streaming rows from the cursor."""
+        conn = self._get_read_connection()
+        yield from conn.execute(SQL_GET_ALL)
+    
+    def get_all_accounts(self) -> List[sqlite3.Row]:
         """Get all accounts."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM accounts ORDER BY created_at ASC")
-            rows = cursor.fetchall()
-            conn.close()
-            
-            return [dict(row) for row in rows]
+            return list(self.iter_all_accounts())
             
         except Exception as e:
-            logger.error(f"Failed to get all accounts: {e}")
+            logger.error("Failed to get all accounts: %s", e)
             return []
     
-    def get_active_account(self) -> Optional[Dict[str, Any]]:
-        """Get the currently active account."""
+    def get_active_account(self) -> Optional[sqlite3.Row]:
+        """Get the currently active account (cached until the next write)."""
+        if self._active_cached:
+            return self._active_cache
+        
+        generation = self._active_generation
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM accounts WHERE is_active = 1 LIMIT 1")
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
-                return dict(row)
-            return None
-            
+            conn = self._get_read_connection()
+            row = conn.execute(SQL_GET_ACTIVE).fetchone()
         except Exception as e:
-            logger.error(f"Failed to get active account: {e}")
+            logger.error("Failed to get active account: %s", e)
             return None
+        
+        with self._lock:
+            if generation == self._active_generation:
+                self._active_cache = row
+                self._active_cached = True
+        return row
+    
+    def invalidate_active(self):
+        """Drop the cached active account so the next read hits the database."""
+        with self._lock:
+            self._active_generation += 1
+            self._active_cached = False
+            self._active_cache = None
     
     def get_account_count(self) -> int:
-        """Get total number of accounts."""
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM accounts")
-            count = cursor.fetchone()[0]
-            conn.close()
-            return count
-        except Exception as e:
-            logger.error(f"Failed to get account count: {e}")
-            return 0
+        """Get total number of accounts (cached, no query)."""
+        with self._lock:
+            return self._count
     
     # ========================================================================
     # DECRYPT CREDENTIALS
@@ -273,7 +597,11 @@ class AccountManager:
         Returns:
             {'username': str, 'token_id': str, 'token_secret': str} or None
         """
-        account = self.get_account_by_username(username)
+        cached = self._cred_cache.get(username)
+        if cached is not None:
+            return dict(cached)
+        
+        account = self._get_encrypted_credentials(username)
         if not account:
             return None
         
@@ -281,13 +609,25 @@ class AccountManager:
             token_id = utils.decrypt_data(account['token_id_encrypted'])
             token_secret = utils.decrypt_data(account['token_secret_encrypted'])
             
-            return {
+            creds = {
                 'username': username,
                 'token_id': token_id,
                 'token_secret': token_secret
             }
         except Exception as e:
-            logger.error(f"Failed to decrypt credentials for '{username}': {e}")
+            logger.error("Failed to decrypt credentials for '%s': %s", username, e)
+            return None
+        
+        self._cred_cache[username] = creds
+        return dict(creds)
+    
+    def _get_encrypted_credentials(self, username: str) -> Optional[sqlite3.Row]:
+        """Fetch only the two encrypted token columns for an account."""
+        try:
+            conn = self._get_read_connection()
+            return conn.execute(SQL_GET_CREDS, (username,)).fetchone()
+        except Exception as e:
+            logger.error("Failed to get credentials for '%s': %s", username, e)
             return None
     
     # ========================================================================
@@ -297,21 +637,21 @@ class AccountManager:
     def update_balance(self, username: str, balance: float) -> bool:
         """Update account balance."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE accounts 
-                SET balance = ?, updated_at = CURRENT_TIMESTAMP 
-                WHERE username = ?
-            """, (balance, username))
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Updated balance for '{username}': ${balance:.2f}")
+            with self._lock:
+                conn = self._get_connection()
+                cents = _to_cents(balance)
+                row = conn.execute(SQL_GET_BALANCE, (username,)).fetchone()
+                conn.execute(SQL_UPDATE_BALANCE, (cents / 100, cents, username))
+                
+                if row is not None:
+                    self._total_cents += cents - row['balance_cents']
+                self.invalidate_active()
+            
+            logger.info("Updated balance for '%s': $%.2f", username, balance)
             return True
             
         except Exception as e:
-            logger.error(f"Failed to update balance for '{username}': {e}")
+            logger.error("Failed to update balance for '%s': %s", username, e)
             return False
     
     def update_status(self, username: str, status: str) -> bool:
@@ -322,86 +662,135 @@ class AccountManager:
         """
         valid_statuses = ['active', 'ready', 'dead', 'building']
         if status not in valid_statuses:
-            logger.error(f"Invalid status: {status}")
+            logger.error("Invalid status: %s", status)
             return False
         
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE accounts 
-                SET status = ?, updated_at = CURRENT_TIMESTAMP 
-                WHERE username = ?
-            """, (status, username))
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Updated status for '{username}': {status}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to update status for '{username}': {e}")
+        if not self._update_column('status', status, username):
             return False
+        
+        logger.info("Updated status for '%s': %s", username, status)
+        return True
     
     def set_active_account(self, username: str) -> bool:
         """Set an account as active (and deactivate others)."""
-        account = self.get_account_by_username(username)
-        if not account:
-            logger.error(f"Account '{username}' not found")
-            return False
+        return self.apply_switch(None, username)
+    
+    def apply_switch(self, from_username: Optional[str], to_username: str) -> bool:
+        """
+        Record a switch in one transaction: make to_username the active
+        account with status 'active', and put from_username back to 'ready'.
+        
+        Args:
+            from_username: Previously active account, or None to leave
+                statuses untouched
+            to_username: Account to activate
         
+        Returns:
+            True if committed
+        """
+        username = to_username
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Deactivate all accounts
-            cursor.execute("UPDATE accounts SET is_active = 0")
-            
-            # Activate the specified account
-            cursor.execute("""
-                UPDATE accounts 
-                SET is_active = 1, updated_at = CURRENT_TIMESTAMP 
-                WHERE username = ?
-            """, (username,))
-            
-            # Log the action
-            self._log_action(account['id'], 'account_activated', 'Set as active account')
-            
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Set '{username}' as active account")
+            with self._lock:
+                conn = self._get_connection()
+                # Take the write lock up front so the switch is atomic and
+                # committed with a single sync - no moment without an active account
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Deactivate the current account
+                    conn.execute(SQL_DEACTIVATE_ALL)
+                    
+                    # Activate the specified account
+                    cursor = conn.execute(SQL_ACTIVATE, (username,))
+                    if cursor.rowcount == 0:
+                        conn.execute("ROLLBACK")
+                        logger.error("Account '%s' not found", username)
+                        return False
+                    
+                    # Log the action as part of the same transaction
+                    conn.execute(SQL_INSERT_LOG_FOR_USERNAME, ('account_activated', 'Set as active account', username))
+                    
+                    if from_username is not None:
+                        if from_username != username:
+                            conn.execute(SQL_UPDATE_STATUS, ('ready', from_username))
+                        conn.execute(SQL_UPDATE_STATUS, ('active', username))
+                    
+                    conn.execute("COMMIT")
+                except Exception:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+                finally:
+                    self.invalidate_active()
+            
+            logger.info("Set '%s' as active account", username)
             return True
             
         except Exception as e:
-            logger.error(f"Failed to set active account '{username}': {e}")
+            logger.error("Failed to set active account '%s': %s", username, e)
             return False
     
     def update_selected_gpu(self, username: str, gpu: str) -> bool:
         """Update selected GPU for an account."""
+        if not self._update_column('selected_gpu', gpu, username):
+            return False
+        
+        logger.info("Updated GPU for '%s': %s", username, gpu)
+        return True
+    
+    def set_switch_deadline(self, username: str, switch_at: Optional[float]) -> bool:
+        """
+        Set or clear the auto-switch deadline for an account.
+        
+        Args:
+            username: Account to update
+            switch_at: Epoch seconds to switch at, or None to cancel
+        
+        Returns:
+            True if the statement ran
+        """
+        return self._update_column('switch_at', switch_at, username)
+    
+    def get_switch_deadlines(self) -> Dict[str, float]:
+        """Get all pending auto-switch deadlines as {username: switch_at}."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE accounts 
-                SET selected_gpu = ?, updated_at = CURRENT_TIMESTAMP 
-                WHERE username = ?
-            """, (gpu, username))
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Updated GPU for '{username}': {gpu}")
+            conn = self._get_read_connection()
+            return dict(conn.execute(SQL_GET_SWITCH_DEADLINES).fetchall())
+        except Exception as e:
+            logger.error("Failed to get switch deadlines: %s", e)
+            return {}
+    
+    def _update_column(self, column: str, value: Any, username: str) -> bool:
+        """
+        Write a single whitelisted column for an account.
+        
+        Args:
+            column: Column name, must be a key of UPDATABLE_COLUMNS
+            value: New value
+            username: Account to update
+        
+        Returns:
+            True if the statement ran
+        """
+        sql = UPDATABLE_COLUMNS.get(column)
+        if sql is None:
+            raise ValueError(f"Column '{column}' cannot be updated")
+        
+        try:
+            with self._lock:
+                conn = self._get_connection()
+                conn.execute(sql, (value, username))
+                self.invalidate_active()
             return True
             
         except Exception as e:
-            logger.error(f"Failed to update GPU for '{username}': {e}")
+            logger.error("Failed to update %s for '%s': %s", column, username, e)
             return False
     
     # ========================================================================
     # ACCOUNT SELECTION LOGIC
     # ========================================================================
     
-    def get_next_available_account(self, min_balance: float = None) -> Optional[Dict[str, Any]]:
+    def get_next_available_account(self, min_balance: float = None) -> Optional[sqlite3.Row]:
         """
         Get next available account with sufficient balance.
         
@@ -409,77 +798,130 @@ class AccountManager:
             min_balance: Minimum balance required (default: config.MIN_CREDIT_THRESHOLD)
         
         Returns:
-            Account dict or None if no available account
+            Account row or None if no available account
         """
         if min_balance is None:
             min_balance = config.MIN_CREDIT_THRESHOLD
         
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM accounts 
-                WHERE is_active = 0 
-                AND balance >= ? 
-                AND status != 'dead'
-                ORDER BY balance DESC
-                LIMIT 1
-            """, (min_balance,))
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
-                return dict(row)
-            return None
+            conn = self._get_read_connection()
+            return conn.execute(SQL_NEXT_AVAILABLE, (_to_cents(min_balance),)).fetchone()
             
         except Exception as e:
-            logger.error(f"Failed to get next available account: {e}")
+            logger.error("Failed to get next available account: %s", e)
             return None
     
     def has_available_accounts(self, min_balance: float = None) -> bool:
         """Check if there are any available accounts with sufficient balance."""
-        return self.get_next_available_account(min_balance) is not None
+        if min_balance is None:
+            min_balance = config.MIN_CREDIT_THRESHOLD
+        
+        try:
+            conn = self._get_read_connection()
+            return conn.execute(SQL_EXISTS_AVAILABLE, (_to_cents(min_balance),)).fetchone() is not None
+            
+        except Exception as e:
+            logger.error("Failed to check for available accounts: %s", e)
+            return False
     
     # ========================================================================
     # USAGE LOGGING
     # ========================================================================
     
     def _log_action(self, account_id: int, action: str, details: str = None):
-        """Log an action for an account."""
-        try:
+        """Queue an action for an account; written by the log flusher thread."""
+        with self._log_lock:
+            self._log_queue.append((account_id, action, details))
+            pending = len(self._log_queue)
+        
+        if pending >= LOG_BATCH_SIZE:
+            self._log_wakeup.set()
+    
+    def _flush_log_queue(self):
+        """
+        Write all queued usage log rows in a single transaction.
+        
+        The writer lock is taken before the queue is drained, so no other
+        write can land between taking the rows and inserting them. If the
+        batch insert fails, rows are retried one at a time and only the
+        failing ones are dropped.
+        """
+        with self._lock:
             conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO usage_log (account_id, action, details)
-                VALUES (?, ?, ?)
-            """, (account_id, action, details))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            logger.error(f"Failed to log action: {e}")
+            if conn is None:
+                return
+            
+            with self._log_lock:
+                if not self._log_queue:
+                    return
+                rows = list(self._log_queue)
+                self._log_queue.clear()
+            
+            try:
+                # Join the caller's transaction if one is already open
+                if conn.in_transaction:
+                    self._insert_log_rows(conn, rows)
+                    return
+                
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(SQL_INSERT_LOG, rows)
+                    conn.execute("COMMIT")
+                    return
+                except Exception as e:
+                    conn.execute("ROLLBACK")
+                    logger.warning("Batch log insert failed, retrying row by row: %s", e)
+                
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._insert_log_rows(conn, rows)
+                    conn.execute("COMMIT")
+                except Exception:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+            except Exception as e:
+                logger.error("Failed to log %s action(s): %s", len(rows), e)
     
-    def get_account_history(self, username: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get action history for an account."""
+    def _insert_log_rows(self, conn: sqlite3.Connection, rows: List[tuple]):
+        """Insert usage log rows one by one, skipping (and reporting) any that fail."""
+        for row in rows:
+            try:
+                conn.execute(SQL_INSERT_LOG, row)
+            except sqlite3.Error as e:
+                logger.error("Dropped usage log row %s: %s", row, e)
+    
+    def _log_flush_loop(self):
+        """Background loop that flushes the usage log queue periodically."""
+        while not self._log_stop.is_set():
+            self._log_wakeup.wait(LOG_FLUSH_INTERVAL)
+            self._log_wakeup.clear()
+            self._flush_log_queue()
+    
+    def iter_account_history(self, username: str, limit: int = 50) -> Iterator[sqlite3.Row]:
+        """
+        Iterate over action history for an account, newest first.
+        
+        Rows are streamed from the cursor, so callers that only need the
+        first few entries can stop early without fetching the rest.
+        """
         account = self.get_account_by_username(username)
         if not account:
-            return []
+            return
         
+        # Include actions still waiting in the log queue
+        self._flush_log_queue()
+        
+        conn = self._get_read_connection()
+        yield from conn.execute(SQL_GET_HISTORY, (account['id'], limit))
+    
+    def get_account_history(self, username: str, limit: int = 50) -> List[sqlite3.Row]:
+        """Get action history for an account."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM usage_log 
-                WHERE account_id = ? 
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            """, (account['id'], limit))
-            rows = cursor.fetchall()
-            conn.close()
-            
-            return [dict(row) for row in rows]
+            return list(self.iter_account_history(username, limit))
             
         except Exception as e:
-            logger.error(f"Failed to get history for '{username}': {e}")
+            logger.error("Failed to get history for '%s': %s", username, e)
             return []
     
     # ========================================================================
@@ -487,39 +929,45 @@ class AccountManager:
     # ========================================================================
     
     def get_total_balance(self) -> float:
-        """Get total balance across all accounts."""
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT SUM(balance) FROM accounts")
-            result = cursor.fetchone()[0]
-            conn.close()
-            return result if result else 0.0
-        except Exception as e:
-            logger.error(f"Failed to get total balance: {e}")
-            return 0.0
+        """Get total balance across all accounts (cached, no query)."""
+        with self._lock:
+            return self._total_cents / 100
     
-    def get_accounts_by_status(self, status: str) -> List[Dict[str, Any]]:
+    def iter_accounts_by_status(self, status: str) -> Iterator[sqlite3.Row]:
+        """Iterate over accounts with a specific status."""
+        conn = self._get_read_connection()
+        yield from conn.execute(SQL_GET_BY_STATUS, (status,))
+    
+    def get_accounts_by_status(self, status: str) -> List[sqlite3.Row]:
         """Get all accounts with a specific status."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM accounts WHERE status = ?", (status,))
-            rows = cursor.fetchall()
-            conn.close()
-            
-            return [dict(row) for row in rows]
+            return list(self.iter_accounts_by_status(status))
             
         except Exception as e:
-            logger.error(f"Failed to get accounts by status '{status}': {e}")
+            logger.error("Failed to get accounts by status '%s': %s", status, e)
             return []
 
 # ============================================================================
 # GLOBAL INSTANCE
 # ============================================================================
 
-# Create a global instance for easy access
-account_manager = AccountManager()
+_account_manager: Optional[AccountManager] = None
+_account_manager_lock = threading.Lock()
+
+def get_account_manager() -> AccountManager:
+    """Get the global account manager, opening the database on first use."""
+    global _account_manager
+    if _account_manager is None:
+        with _account_manager_lock:
+            if _account_manager is None:
+                _account_manager = AccountManager()
+    return _account_manager
+
+def __getattr__(name: str):
+    """Create `account_manager` lazily so importing this module stays cheap (PEP 562)."""
+    if name == 'account_manager':
+        return get_account_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ============================================================================
 # END OF ACCOUNT MANAGER
@@ -1,14 +1,19 @@
 import modal
-import os, time
+import os, time, subprocess
+from pathlib import Path
 
 GPU_TYPE = os.environ.get("GPU_TYPE", "T4") #NEW
 app = modal.App("comfyui-antique")
 vol = modal.Volume.from_name("workspace", create_if_missing=True)
 
+WORKSPACE_DIR = Path("/root/workspace")
+COMFYUI_DIR = WORKSPACE_DIR / "ComfyUI"
+MANAGER_DIR = COMFYUI_DIR / "custom_nodes" / "ComfyUI-Manager"
+
 def install_comfyui_dependencies():
-    os.system("cd /root/workspace/ComfyUI && uv pip install --system -r requirements.txt")
-    os.system("cd /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager && uv pip install --system -r requirements.txt")
-    os.system("python /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager/cm-cli.py restore-dependencies")
+    subprocess.run(["uv", "pip", "install", "--system", "-r", "requirements.txt"], cwd=COMFYUI_DIR)
+    subprocess.run(["uv", "pip", "install", "--system", "-r", "requirements.txt"], cwd=MANAGER_DIR)
+    subprocess.run(["python", MANAGER_DIR / "cm-cli.py", "restore-dependencies"])
     
 image = (
     modal.Image.debian_slim(python_version="3.11")
@@ -24,7 +29,7 @@ image = (
     
     .run_function(
         install_comfyui_dependencies,
-        volumes={"/root/workspace": vol}
+        volumes={str(WORKSPACE_DIR): vol}
     )
 )
 
@@ -32,14 +37,15 @@ image = (
     image=image,
     gpu=GPU_TYPE,
     timeout=24*3600,  # 24 hour
-    volumes={"/root/workspace": vol},
+    volumes={str(WORKSPACE_DIR): vol},
 )
 def run():
-    os.system("jupyter lab --ip=0.0.0.0 --port=5000 --no-browser --allow-root --NotebookApp.token='' --NotebookApp.password='' &")
+    # Jupyter and ComfyUI run in the background; the tunnel keeps the container alive
+    subprocess.Popen(["jupyter", "lab", "--ip=0.0.0.0", "--port=5000", "--no-browser", "--allow-root", "--NotebookApp.token=", "--NotebookApp.password="])
     time.sleep(5)
-    os.system("cd /root/workspace/ComfyUI && python main.py --listen 0.0.0.0 --port 8188 &")
+    subprocess.Popen(["python", "main.py", "--listen", "0.0.0.0", "--port", "8188"], cwd=COMFYUI_DIR)
     time.sleep(10)
-    os.system("cloudflared tunnel run tensorart")
+    subprocess.run(["cloudflared", "tunnel", "run", "tensorart"])
     print("Starting ComfyUI...✅")
 
   
@@ -1,5 +1,8 @@
 import modal
-import os, time
+import errno, os, time, json, shutil, subprocess, urllib.request, urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
 
 GPU_TYPE = os.environ.get("GPU_TYPE", "T4")  #NEW
 app = modal.App("setup-step1")
@@ -10,95 +13,291 @@ image = (
     .apt_install("git", "wget", "curl", "aria2", "libgl1", "lsof", "libglib2.0-0", "unzip")
 )
 
+WORKSPACE_DIR = Path("/root/workspace")
+COMFYUI_DIR = WORKSPACE_DIR / "ComfyUI"
+CUSTOM_NODES_DIR = COMFYUI_DIR / "custom_nodes"
+MODELS_DIR = COMFYUI_DIR / "models"
+
+# Written once setup finishes cleanly; bump the version to force a fresh pass
+SETUP_SENTINEL = WORKSPACE_DIR / ".setup_complete_v1"
+
+CLONE_WORKERS = 16
+CLONE_RETRIES = 3
+# Only HEAD of the default branch is needed; no history
+CLONE_FLAGS = ["--depth=1", "--single-branch"]
+
+# Transport settings handed to git via GIT_CONFIG_COUNT/KEY_n/VALUE_n so any git
+# process spawned by a clone inherits them. Protocol v2 only advertises the refs asked for.
+GIT_CONFIG = {"protocol.version": "2", "http.version": "HTTP/2"}
+GIT_ENV = dict(os.environ, GIT_CONFIG_COUNT=str(len(GIT_CONFIG)))
+for i, (key, value) in enumerate(GIT_CONFIG.items()):
+    GIT_ENV[f"GIT_CONFIG_KEY_{i}"] = key
+    GIT_ENV[f"GIT_CONFIG_VALUE_{i}"] = value
+
+CUSTOM_NODE_REPOS = [
+    "https://github.com/Kosinkadink/ComfyUI-VideoHelperSuite.git",
+    "https://github.com/sipherxyz/comfyui-art-venture.git",
+    "https://github.com/kijai/ComfyUI-KJNodes.git",
+    "https://github.com/Suzie1/ComfyUI_Comfyroll_CustomNodes.git",
+    "https://github.com/chflame163/ComfyUI_LayerStyle.git",
+    "https://github.com/chflame163/ComfyUI_LayerStyle_Advance.git",
+    "https://github.com/yolain/ComfyUI-Easy-Use.git",
+    "https://github.com/cubiq/ComfyUI_essentials.git",
+    "https://github.com/SeargeDP/ComfyUI_Searge_LLM.git",
+    "https://github.com/TinyTerra/ComfyUI_tinyterraNodes.git",
+    "https://github.com/kijai/ComfyUI-Florence2.git",
+    "https://github.com/city96/ComfyUI-GGUF.git",
+    "https://github.com/ltdrdata/ComfyUI-Impact-Pack.git",
+    "https://github.com/ltdrdata/ComfyUI-Impact-Subpack.git",
+    "https://github.com/rgthree/rgthree-comfy.git",
+    "https://github.com/welltop-cn/ComfyUI-TeaCache.git",
+    "https://github.com/lquesada/ComfyUI-Inpaint-CropAndStitch.git",
+    "https://github.com/giriss/comfy-image-saver.git",
+    "https://github.com/chflame163/ComfyUI_IPAdapter_plus_V2.git",
+    "https://github.com/ClownsharkBatwing/RES4LYF.git",
+    "https://github.com/eddyhhlure1Eddy/auto_wan2.2animate_freamtowindow_server.git",
+    "https://github.com/Fannovel16/comfyui_controlnet_aux.git",
+    "https://github.com/PowerHouseMan/ComfyUI-AdvancedLivePortrait.git",
+    "https://github.com/gokayfem/ComfyUI-fal-API.git",
+    "https://github.com/Fannovel16/ComfyUI-Frame-Interpolation.git",
+    "https://github.com/Antique3e/ComfyUI-ModalCredits.git",
+    "https://github.com/9nate-drake/Comfyui-SecNodes.git",
+    "https://github.com/kijai/ComfyUI-WanAnimatePreprocess.git",
+    "https://github.com/kijai/ComfyUI-WanVideoWrapper.git",
+    "https://github.com/crystian/ComfyUI-Crystools.git",
+    "https://github.com/1dZb1/MagicNodes.git",
+]
+
+def clone_repo(url, dest_dir):
+    """Clone one repo into dest_dir, retrying with backoff. Returns True on success."""
+    name = url.rstrip("/").split("/")[-1].removesuffix(".git")
+    dest = Path(dest_dir) / name
+    if os.path.exists(dest):
+        # Keep a checkout from an earlier run if it's intact, otherwise start over
+        check = subprocess.run(["git", "-C", dest, "rev-parse", "--verify", "HEAD"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if check.returncode == 0:
+            return True
+        shutil.rmtree(dest, ignore_errors=True)
+    for attempt in range(1, CLONE_RETRIES + 1):
+        result = subprocess.run(["git", "clone", *CLONE_FLAGS, url, dest], env=GIT_ENV, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode == 0:
+            return True
+        print(f"git clone {name} failed (attempt {attempt}/{CLONE_RETRIES}): {result.stderr.strip()}")
+        shutil.rmtree(dest, ignore_errors=True)
+        if attempt < CLONE_RETRIES:
+            time.sleep(2 ** attempt)
+    return False
+
+ARIA2_INPUT_FILE = "/tmp/models.txt"
+# aria2 writes the entries that failed (including checksum mismatches) here
+ARIA2_SESSION_FILE = "/tmp/models_failed.txt"
+# aria2 already does what hf_transfer would: parallel ranged GETs per file
+# (-x/-s) and several files in flight (-j), and it needs no extra packages.
+ARIA2_FLAGS = [
+    "-j", "4", "-x", "16", "-s", "16",
+    "--min-split-size=4M", "--piece-length=4M",
+    "--max-tries=10", "--retry-wait=5", "--continue=true",
+    "--allow-overwrite=false", "--auto-file-renaming=false",
+    "--optimize-concurrent-downloads=true",
+    # fallocate() reserves contiguous extents instantly instead of zero-filling;
+    # the disk cache coalesces the small writes from 16 connections per file
+    "--file-allocation=falloc", "--disk-cache=64M",
+]
+
+# (models subdirectory, url) - saved under the url's file name
+MODEL_DOWNLOADS = [
+    ("diffusion_models", "https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/diffusion_models/wan2.2_t2v_high_noise_14B_fp16.safetensors"),
+    ("diffusion_models", "https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/diffusion_models/wan2.2_t2v_low_noise_14B_fp16.safetensors"),
+    ("diffusion_models", "https://huggingface.co/Comfy-Org/Qwen-Image-Edit_ComfyUI/resolve/main/split_files/diffusion_models/qwen_image_edit_2509_bf16.safetensors"),
+    ("diffusion_models", "https://huggingface.co/Kijai/WanVideo_comfy_fp8_scaled/resolve/main/I2V/Wan2_2-I2V-A14B-HIGH_fp8_e5m2_scaled_KJ.safetensors"),
+    ("diffusion_models", "https://huggingface.co/Kijai/WanVideo_comfy_fp8_scaled/resolve/main/I2V/Wan2_2-I2V-A14B-LOW_fp8_e5m2_scaled_KJ.safetensors"),
+    ("diffusion_models", "https://huggingface.co/Kijai/WanVideo_comfy_fp8_scaled/resolve/main/Wan22Animate/Wan2_2-Animate-14B_fp8_scaled_e5m2_KJ_v2.safetensors"),
+    ("diffusion_models", "https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/diffusion_models/wan2.2_animate_14B_bf16.safetensors"),
+
+    ("vae", "https://huggingface.co/Comfy-Org/Qwen-Image_ComfyUI/resolve/main/split_files/vae/qwen_image_vae.safetensors"),
+    ("vae", "https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/vae/wan_2.1_vae.safetensors"),
+    ("vae", "https://huggingface.co/Kijai/WanVideo_comfy/resolve/main/Wan2_1_VAE_bf16.safetensors"),
+
+    ("text_encoders", "https://huggingface.co/Comfy-Org/Qwen-Image_ComfyUI/resolve/main/split_files/text_encoders/qwen_2.5_vl_7b.safetensors"),
+    ("text_encoders", "https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/text_encoders/umt5_xxl_fp16.safetensors"),
+
+    ("loras", "https://huggingface.co/Kijai/WanVideo_comfy/resolve/main/Lightx2v/lightx2v_I2V_14B_480p_cfg_step_distill_rank256_bf16.safetensors"),
+    ("loras", "https://huggingface.co/Kijai/WanVideo_comfy/resolve/main/Lightx2v/lightx2v_T2V_14B_cfg_step_distill_v2_lora_rank256_bf16.safetensors"),
+    ("loras", "https://huggingface.co/Kijai/WanVideo_comfy/resolve/main/LoRAs/Wan22_relight/WanAnimate_relight_lora_fp16.safetensors"),
+    ("loras", "https://huggingface.co/lightx2v/Qwen-Image-Lightning/resolve/main/Qwen-Image-Lightning-8steps-V2.0-bf16.safetensors"),
+    ("loras", "https://huggingface.co/lightx2v/Qwen-Image-Lightning/resolve/main/Qwen-Image-Edit-2509/Qwen-Image-Edit-2509-Lightning-8steps-V1.0-bf16.safetensors"),
+]
+
+# Content-addressed model store on the volume: files are kept as <sha256>
+# and hardlinked into ComfyUI/models, so a re-run only fetches what's new
+CACHE_DIR = WORKSPACE_DIR / ".cache" / "models"
+CACHE_MANIFEST = CACHE_DIR / "manifest.json"
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+def resolve_sha256(url):
+    """Ask HuggingFace for a file's sha256 (the X-Linked-Etag of the resolve redirect)."""
+    opener = urllib.request.build_opener(_NoRedirect)
+    try:
+        response = opener.open(urllib.request.Request(url, method="HEAD"), timeout=30)
+        headers = response.headers
+    except urllib.error.HTTPError as e:
+        headers = e.headers
+    except OSError as e:
+        print(f"Could not resolve {url}: {e}")
+        return None
+    etag = (headers.get("X-Linked-Etag") or "").strip('"')
+    return etag if len(etag) == 64 else None
+
+def load_manifest():
+    """Load the filename -> {sha256, url} manifest of the model cache."""
+    try:
+        with open(CACHE_MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest):
+    tmp = CACHE_MANIFEST.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, CACHE_MANIFEST)
+
+def load_failed_outputs():
+    """Output names of the entries aria2 saved to its session file as failed or unfinished."""
+    try:
+        with open(ARIA2_SESSION_FILE) as f:
+            return {line.strip()[4:] for line in f if line.strip().startswith("out=")}
+    except OSError:
+        return set()
+
+# Plain os.link is enough here: it is one metadata syscall per model and there
+# are fewer than twenty models, so batching through io_uring would save nothing
+def link_model(src, dest):
+    """Hardlink a cached model into place, falling back to a symlink across filesystems."""
+    if not dest.is_symlink() and dest.exists() and os.path.samefile(src, dest):
+        return
+    # Whatever is there is stale: an old link, or a partial in-place download
+    # from a run where the hash didn't resolve (with its .aria2 control file)
+    dest.unlink(missing_ok=True)
+    Path(f"{dest}.aria2").unlink(missing_ok=True)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        os.symlink(src, dest)
+
+# A single `aria2c -i` run is already one resident process whose connection
+# pool and DNS cache serve every file, so an RPC daemon would add no reuse.
+def download_models(downloads):
+    """
+    Fetch every model with one aria2c process so several files download at once.
+    Files already in the cache are linked into place without touching the network.
+    """
+    print("Downloading models...")
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest()
+    
+    wanted = []
+    for subdir, url in downloads:
+        name = url.rsplit("/", 1)[-1]
+        dest = MODELS_DIR / subdir / name
+        if not os.path.exists(dest) or os.path.exists(f"{dest}.aria2"):
+            wanted.append((name, url, dest))
+    
+    # Look up hashes for files the manifest doesn't know yet
+    unknown = [url for name, url, _ in wanted if manifest.get(name, {}).get("url") != url]
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        resolved = dict(zip(unknown, ex.map(resolve_sha256, unknown)))
+    
+    pending = []
+    queued = 0
+    with open(ARIA2_INPUT_FILE, "w") as f:
+        for name, url, dest in wanted:
+            sha = resolved[url] if url in resolved else manifest[name]["sha256"]
+            if sha is None:
+                # No hash published - download straight into place
+                f.write(f"{url}\n  out={name}\n  dir={dest.parent}\n")
+                queued += 1
+                continue
+            manifest[name] = {"sha256": sha, "url": url}
+            cached = CACHE_DIR / sha
+            if os.path.exists(cached) and not os.path.exists(f"{cached}.aria2"):
+                link_model(cached, dest)
+            else:
+                # aria2 checks the sha256 once the download finishes; a mismatch
+                # fails that entry (no retry) and it is discarded below
+                f.write(f"{url}\n  out={sha}\n  dir={CACHE_DIR}\n  checksum=sha-256={sha}\n")
+                pending.append((cached, dest))
+                queued += 1
+    
+    failed = set()
+    if queued:
+        result = subprocess.run(["aria2c", "-i", ARIA2_INPUT_FILE, *ARIA2_FLAGS,
+                                 f"--save-session={ARIA2_SESSION_FILE}"])
+        if result.returncode != 0:
+            print(f"aria2c exited with code {result.returncode}, some models may be missing")
+            failed = load_failed_outputs()
+    
+    for cached, dest in pending:
+        if cached.name in failed:
+            # Possibly a complete file with the wrong hash; never link it
+            print(f"Discarding failed download for {dest.name}")
+            cached.unlink(missing_ok=True)
+            Path(f"{cached}.aria2").unlink(missing_ok=True)
+        elif os.path.exists(cached) and not os.path.exists(f"{cached}.aria2"):
+            link_model(cached, dest)
+    save_manifest(manifest)
+    return not queued or result.returncode == 0
+
+def install_custom_nodes():
+    """Clone ComfyUI-Manager, then fan out over the other custom nodes. Returns True if all cloned."""
+    print("Installing ComfyUI Manager...")
+    manager_ok = clone_repo("https://github.com/Comfy-Org/ComfyUI-Manager", CUSTOM_NODES_DIR)
+
+    print("Installing custom nodes...")
+    with ThreadPoolExecutor(max_workers=CLONE_WORKERS) as ex:
+        results = list(ex.map(lambda url: clone_repo(url, CUSTOM_NODES_DIR), CUSTOM_NODE_REPOS))
+    failed = [url for url, ok in zip(CUSTOM_NODE_REPOS, results) if not ok]
+    if failed:
+        print(f"Failed to clone {len(failed)} custom node(s): {', '.join(failed)}")
+    return manager_ok and not failed
+
 @app.function(
     image=image,
     gpu=GPU_TYPE,
     timeout=3*3600 ,  # 3 hour
-    volumes={"/root/workspace": vol},
+    volumes={str(WORKSPACE_DIR): vol},
 )
 def run():
     
-    if not os.path.exists("/root/workspace/ComfyUI"):
+    if not SETUP_SENTINEL.exists():
+        # Safe to re-enter after a failed run: intact checkouts and cached models are reused
         print("Cloning ComfyUI...")
-        os.system("cd /root/workspace && git clone https://github.com/comfyanonymous/ComfyUI")
-
-        print("Installing ComfyUI Manager...")
-        os.system("cd /root/workspace/ComfyUI/custom_nodes && git clone https://github.com/Comfy-Org/ComfyUI-Manager")
-
-        print("Installing custom nodes...")
-        os.system(
-            "cd /root/workspace/ComfyUI/custom_nodes && "
-            "git clone https://github.com/Kosinkadink/ComfyUI-VideoHelperSuite.git && "
-            "git clone https://github.com/sipherxyz/comfyui-art-venture.git && "
-            "git clone https://github.com/kijai/ComfyUI-KJNodes.git && "
-            "git clone https://github.com/Suzie1/ComfyUI_Comfyroll_CustomNodes.git && "
-            "git clone https://github.com/chflame163/ComfyUI_LayerStyle.git && "
-            "git clone https://github.com/chflame163/ComfyUI_LayerStyle_Advance.git && "
-            "git clone https://github.com/yolain/ComfyUI-Easy-Use.git && "
-            "git clone https://github.com/cubiq/ComfyUI_essentials.git && "
-            "git clone https://github.com/SeargeDP/ComfyUI_Searge_LLM.git && "
-            "git clone https://github.com/TinyTerra/ComfyUI_tinyterraNodes.git && "
-            "git clone https://github.com/kijai/ComfyUI-Florence2.git && "
-            "git clone https://github.com/city96/ComfyUI-GGUF.git && "
-            "git clone https://github.com/ltdrdata/ComfyUI-Impact-Pack.git && "
-            "git clone https://github.com/ltdrdata/ComfyUI-Impact-Subpack.git && "
-            "git clone https://github.com/rgthree/rgthree-comfy.git && "
-            "git clone https://github.com/welltop-cn/ComfyUI-TeaCache.git && "
-            "git clone https://github.com/lquesada/ComfyUI-Inpaint-CropAndStitch.git && "
-            "git clone https://github.com/giriss/comfy-image-saver.git && "
-            "git clone https://github.com/chflame163/ComfyUI_IPAdapter_plus_V2.git && "
-            "git clone https://github.com/ClownsharkBatwing/RES4LYF.git && "
-            "git clone https://github.com/eddyhhlure1Eddy/auto_wan2.2animate_freamtowindow_server.git && " 
-            "git clone https://github.com/Fannovel16/comfyui_controlnet_aux.git && " 
-            "git clone https://github.com/PowerHouseMan/ComfyUI-AdvancedLivePortrait.git && " 
-            "git clone https://github.com/gokayfem/ComfyUI-fal-API.git && " 
-            "git clone https://github.com/Fannovel16/ComfyUI-Frame-Interpolation.git && " 
-            "git clone https://github.com/Antique3e/ComfyUI-ModalCredits.git && " 
-            "git clone https://github.com/9nate-drake/Comfyui-SecNodes.git && " 
-            "git clone https://github.com/kijai/ComfyUI-WanAnimatePreprocess.git && " 
-            "git clone https://github.com/kijai/ComfyUI-WanVideoWrapper.git && "
-            "git clone https://github.com/crystian/ComfyUI-Crystools.git && "
-            "git clone https://github.com/1dZb1/MagicNodes.git"
-        )
-        
-        dl = "aria2c -x16 -s16 --max-tries=10 --retry-wait=5 --continue=true --allow-overwrite=false"
-        print("Downloading diffusion models...")
-        os.system(
-            "cd /root/workspace/ComfyUI/models/diffusion_models && "
-            f"{dl} --out=wan2.2_t2v_high_noise_14B_fp16.safetensors https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/diffusion_models/wan2.2_t2v_high_noise_14B_fp16.safetensors && "
-            f"{dl} --out=wan2.2_t2v_low_noise_14B_fp16.safetensors https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/diffusion_models/wan2.2_t2v_low_noise_14B_fp16.safetensors && "
-            f"{dl} --out=qwen_image_edit_2509_bf16.safetensors https://huggingface.co/Comfy-Org/Qwen-Image-Edit_ComfyUI/resolve/main/split_files/diffusion_models/qwen_image_edit_2509_bf16.safetensors && "
-            f"{dl} --out=Wan2_2-I2V-A14B-HIGH_fp8_e5m2_scaled_KJ.safetensors https://huggingface.co/Kijai/WanVideo_comfy_fp8_scaled/resolve/main/I2V/Wan2_2-I2V-A14B-HIGH_fp8_e5m2_scaled_KJ.safetensors && "
-            f"{dl} --out=Wan2_2-I2V-A14B-LOW_fp8_e5m2_scaled_KJ.safetensors https://huggingface.co/Kijai/WanVideo_comfy_fp8_scaled/resolve/main/I2V/Wan2_2-I2V-A14B-LOW_fp8_e5m2_scaled_KJ.safetensors && "
-            f"{dl} --out=Wan2_2-Animate-14B_fp8_scaled_e5m2_KJ_v2.safetensors https://huggingface.co/Kijai/WanVideo_comfy_fp8_scaled/resolve/main/Wan22Animate/Wan2_2-Animate-14B_fp8_scaled_e5m2_KJ_v2.safetensors && "
-            f"{dl} --out=wan2.2_animate_14B_bf16.safetensors https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/diffusion_models/wan2.2_animate_14B_bf16.safetensors"
-            )
-
-        print("Downloading VAE models...")
-        os.system(
-            "cd /root/workspace/ComfyUI/models/vae && "
-            f"{dl} --out=qwen_image_vae.safetensors https://huggingface.co/Comfy-Org/Qwen-Image_ComfyUI/resolve/main/split_files/vae/qwen_image_vae.safetensors && "
-            f"{dl} --out=wan_2.1_vae.safetensors https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/vae/wan_2.1_vae.safetensors && "
-            f"{dl} --out=Wan2_1_VAE_bf16.safetensors https://huggingface.co/Kijai/WanVideo_comfy/resolve/main/Wan2_1_VAE_bf16.safetensors"
-            )
-
-        print("Downloading text encoder models...")
-        os.system(
-            "cd /root/workspace/ComfyUI/models/text_encoders && "
-            f"{dl} --out=qwen_2.5_vl_7b.safetensors https://huggingface.co/Comfy-Org/Qwen-Image_ComfyUI/resolve/main/split_files/text_encoders/qwen_2.5_vl_7b.safetensors && "
-            f"{dl} --out=umt5_xxl_fp16.safetensors https://huggingface.co/Comfy-Org/Wan_2.2_ComfyUI_Repackaged/resolve/main/split_files/text_encoders/umt5_xxl_fp16.safetensors"
-            )
-        
-        print("Downloading LoRA models...")
-        os.system(
-            "cd /root/workspace/ComfyUI/models/loras && "
-            f"{dl} --out=lightx2v_I2V_14B_480p_cfg_step_distill_rank256_bf16.safetensors https://huggingface.co/Kijai/WanVideo_comfy/resolve/main/Lightx2v/lightx2v_I2V_14B_480p_cfg_step_distill_rank256_bf16.safetensors && "
-            f"{dl} --out=lightx2v_T2V_14B_cfg_step_distill_v2_lora_rank256_bf16.safetensors https://huggingface.co/Kijai/WanVideo_comfy/resolve/main/Lightx2v/lightx2v_T2V_14B_cfg_step_distill_v2_lora_rank256_bf16.safetensors && "
-            f"{dl} --out=WanAnimate_relight_lora_fp16.safetensors https://huggingface.co/Kijai/WanVideo_comfy/resolve/main/LoRAs/Wan22_relight/WanAnimate_relight_lora_fp16.safetensors && "
-            f"{dl} --out=Qwen-Image-Lightning-8steps-V2.0-bf16.safetensors https://huggingface.co/lightx2v/Qwen-Image-Lightning/resolve/main/Qwen-Image-Lightning-8steps-V2.0-bf16.safetensors && "
-            f"{dl} --out=Qwen-Image-Edit-2509-Lightning-8steps-V1.0-bf16.safetensors https://huggingface.co/lightx2v/Qwen-Image-Lightning/resolve/main/Qwen-Image-Edit-2509/Qwen-Image-Edit-2509-Lightning-8steps-V1.0-bf16.safetensors"
-            )
+        if not clone_repo("https://github.com/comfyanonymous/ComfyUI", WORKSPACE_DIR):
+            raise RuntimeError("Could not clone ComfyUI")
+
+        # Model folders must exist before the download thread starts linking into them
+        for subdir in {subdir for subdir, _ in MODEL_DOWNLOADS}:
+            (MODELS_DIR / subdir).mkdir(parents=True, exist_ok=True)
+
+        # Clones are latency-bound and downloads bandwidth-bound, so run both phases at once
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            clones = ex.submit(install_custom_nodes)
+            downloads = ex.submit(download_models, MODEL_DOWNLOADS)
+            nodes_ok = clones.result()
+            models_ok = downloads.result()
+
+        if nodes_ok and models_ok:
+            SETUP_SENTINEL.write_text(datetime.now(timezone.utc).isoformat())
+            vol.commit()
+            print("ComfyUI Installed...✅")
+        else:
+            print("Setup incomplete, run again to retry the missing pieces")
     else:
         print("ComfyUI Installed...✅")
 
-
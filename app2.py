@@ -1,14 +1,44 @@
 import modal
-import os, time
+import os, time, subprocess
+from pathlib import Path
 
 GPU_TYPE = os.environ.get("GPU_TYPE", "T4") #NEW
 app = modal.App("setup-step2")
 vol = modal.Volume.from_name("workspace", create_if_missing=True)
 
+WORKSPACE_DIR = Path("/root/workspace")
+COMFYUI_DIR = WORKSPACE_DIR / "ComfyUI"
+CUSTOM_NODES_DIR = COMFYUI_DIR / "custom_nodes"
+ALL_REQUIREMENTS = "/tmp/all_reqs.txt"
+
+def sh(argv, cwd=None, check=True):
+    """Run one command without a shell; raises on failure when check is set."""
+    return subprocess.run(argv, cwd=cwd, check=check)
+
 def install_comfyui_dependencies():
-    os.system("cd /root/workspace/ComfyUI && uv pip install --system -r requirements.txt")
-    os.system("cd /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager && uv pip install --system -r requirements.txt")
-    os.system("python /root/workspace/ComfyUI/custom_nodes/ComfyUI-Manager/cm-cli.py restore-dependencies")
+    # Merge ComfyUI's and every custom node's requirements so uv resolves them once
+    req_files = [COMFYUI_DIR / "requirements.txt"]
+    req_files += sorted(CUSTOM_NODES_DIR.glob("*/requirements.txt"))
+    with open(ALL_REQUIREMENTS, "w") as out:
+        for path in req_files:
+            with open(path) as f:
+                out.write(f.read().rstrip("\n") + "\n")
+    merged = sh(["uv", "pip", "install", "--system", "--compile-bytecode", "-r", ALL_REQUIREMENTS], check=False)
+    if merged.returncode != 0:
+        # One node's conflicting pin sinks the merged resolve; install file by
+        # file so only that node misses its requirements
+        print("Merged requirements failed to resolve, installing per file")
+        for path in req_files:
+            result = sh(["uv", "pip", "install", "--system", "--compile-bytecode", "-r", path], check=False)
+            if result.returncode != 0:
+                print(f"Skipping requirements that failed to install: {path}")
+    
+    # Still run the Manager's restore for node install scripts; their requirements are already satisfied.
+    # A single broken node script shouldn't fail the image build.
+    sh(["python", CUSTOM_NODES_DIR / "ComfyUI-Manager" / "cm-cli.py", "restore-dependencies"], check=False)
+    
+    # Byte-compile ComfyUI and the custom nodes on all cores so the first launch doesn't have to
+    sh(["python", "-m", "compileall", "-j", "0", "-q", COMFYUI_DIR], check=False)
     
 image = (
     modal.Image.debian_slim(python_version="3.11")
@@ -24,7 +54,7 @@ image = (
            
     .run_function(
         install_comfyui_dependencies,
-        volumes={"/root/workspace": vol}
+        volumes={str(WORKSPACE_DIR): vol}
     )
 )
 
@@ -32,7 +62,7 @@ image = (
     image=image,
     gpu=GPU_TYPE,
     timeout=1*3600,  # 1 hour
-    volumes={"/root/workspace": vol},
+    volumes={str(WORKSPACE_DIR): vol},
 )
 def run():
     print("Dependencies Installed...✅")
@@ -8,12 +8,10 @@ For visual/UI changes, edit ui_config.py instead.
 """
 
 import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
-
 # ============================================================================
 # PROJECT PATHS
 # ============================================================================
@@ -26,11 +24,41 @@ DATABASE_FILE = BASE_DIR / "accounts.db"
 
 # Logs directory
 LOGS_DIR = BASE_DIR / "logs"
-LOGS_DIR.mkdir(exist_ok=True)
 
 # Temp directory for file downloads
 TEMP_DIR = BASE_DIR / "temp"
-TEMP_DIR.mkdir(exist_ok=True)
+
+# ============================================================================
+# ENVIRONMENT VARIABLE HELPERS
+# ============================================================================
+
+def load_env_file():
+    """Load environment variables from .env file if it exists."""
+    env_file = BASE_DIR / '.env'
+    if env_file.exists():
+        load_dotenv(env_file)
+        print(f"Loaded environment variables from {env_file}")
+    else:
+        print("No .env file found. Make sure to set environment variables manually.")
+
+# ============================================================================
+# BOOTSTRAP
+# ============================================================================
+
+_bootstrapped = False
+
+def _bootstrap():
+    """Load .env and create runtime directories. Only does work once per process."""
+    global _bootstrapped
+    if _bootstrapped:
+        return
+    load_env_file()
+    LOGS_DIR.mkdir(exist_ok=True)
+    TEMP_DIR.mkdir(exist_ok=True)
+    _bootstrapped = True
+
+# Runs before the environment-backed settings below are read
+_bootstrap()
 
 # ============================================================================
 # MODAL CONFIGURATION
@@ -164,7 +192,7 @@ DISCORD_CHANNELS = {
 ENCRYPTION_KEY_FILE = BASE_DIR / ".encryption_key"
 
 # Allowed file extensions for outputs
-ALLOWED_OUTPUT_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.mp4', '.webm', '.webp']
+ALLOWED_OUTPUT_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.mp4', '.webm', '.webp')  # Tuple for str.endswith
 
 # Maximum file size for Discord uploads (in MB)
 MAX_DISCORD_FILE_SIZE = 25  # Discord limit is 25MB for regular users
@@ -218,7 +246,7 @@ WORKFLOW_CHANNEL = {
 }
 
 # Workflow file extensions
-WORKFLOW_EXTENSIONS = ['.json']
+WORKFLOW_EXTENSIONS = ('.json',)
 
 # ============================================================================
 # MODAL CLI COMMANDS
@@ -238,6 +266,10 @@ MODAL_COMMANDS = {
     'volume_get': 'modal volume get {volume_name} {remote_path} {local_path}',
 }
 
+# Same commands pre-split into argv lists once at import. Each placeholder is a
+# whole argument, so values are substituted per argument and never re-split
+MODAL_ARGV = {name: template.split() for name, template in MODAL_COMMANDS.items()}
+
 # ============================================================================
 # API REQUEST CONFIGURATION
 # ============================================================================
@@ -298,12 +330,17 @@ def validate_config():
     
     return True
 
-def get_modal_command(command_name, **kwargs):
-    """Get a formatted Modal CLI command."""
-    template = MODAL_COMMANDS.get(command_name)
-    if not template:
+def get_modal_argv(command_name, **kwargs):
+    """Get a Modal CLI command as an argv list (for running without a shell)."""
+    return list(_format_modal_argv(command_name, **kwargs))
+
+@lru_cache(maxsize=64)
+def _format_modal_argv(command_name, **kwargs):
+    """Format an argv template once per argument set; a tuple so it can be shared."""
+    argv = MODAL_ARGV.get(command_name)
+    if not argv:
         raise ValueError(f"Unknown Modal command: {command_name}")
-    return template.format(**kwargs)
+    return tuple(arg.format(**kwargs) if '{' in arg else arg for arg in argv)
 
 # ============================================================================
 # INITIALIZATION
@@ -311,9 +348,8 @@ def get_modal_command(command_name, **kwargs):
 
 def initialize():
     """Initialize configuration (create directories, etc.)."""
-    # Create required directories
-    LOGS_DIR.mkdir(exist_ok=True)
-    TEMP_DIR.mkdir(exist_ok=True)
+    # Directories already exist unless import-time bootstrap was skipped
+    _bootstrap()
     
     # Generate encryption key if it doesn't exist
     if not ENCRYPTION_KEY_FILE.exists():
@@ -324,23 +360,6 @@ def initialize():
     
     print("Configuration initialized successfully!")
 
-# ============================================================================
-# ENVIRONMENT VARIABLE HELPERS
-# ============================================================================
-
-def load_env_file():
-    """Load environment variables from .env file if it exists."""
-    env_file = BASE_DIR / '.env'
-    if env_file.exists():
-        from dotenv import load_dotenv
-        load_dotenv(env_file)
-        print(f"Loaded environment variables from {env_file}")
-    else:
-        print("No .env file found. Make sure to set environment variables manually.")
-
-# Auto-load .env on import
-load_env_file()
-
 # ============================================================================
 # END OF CONFIGURATION
 # ============================================================================
@@ -17,9 +17,13 @@ from discord.ext import commands, tasks
 from discord import option
 from discord.ext import commands, tasks
 import asyncio
+import io
 import logging
+import operator
 import logging.config
 import sys
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from pathlib import Path
@@ -28,7 +32,7 @@ from pathlib import Path
 import config
 import utils
 from ui_config import COLORS, ICONS, MESSAGES, BUTTON_LABELS, get_battery_icon, format_currency
-from account_manager import account_manager
+from account_manager import get_account_manager
 from modal_manager import modal_manager
 from workflow_manager import initialize_workflow_manager, workflow_manager as wf_manager
 
@@ -47,14 +51,86 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
 
-bot = discord.Bot(intents=intents)
+# Fire-and-forget work (auto-switches, setups). Holding the tasks here keeps
+# them from being garbage collected mid-flight and lets shutdown reap them.
+_background_tasks: set = set()
+
+def _schedule(coro) -> asyncio.Task:
+    """Start a background task and track it until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+class ComfyBot(discord.Bot):
+    """Bot that cancels tracked background tasks on shutdown."""
+    
+    async def close(self):
+        for task in list(_background_tasks):
+            task.cancel()
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+        await utils.close_session()
+        await super().close()
+
+bot = ComfyBot(intents=intents)
 
 # Initialize workflow manager with bot
 workflow_manager = None
 
-# Track warnings sent (to avoid spam)
-warning_sent = {}
-switch_timers = {}
+# Auto-switch deadlines live in the accounts table (switch_at) so they survive
+# restarts; one scheduler task sleeps until the earliest and is woken on changes
+_switch_wakeup = asyncio.Event()
+_switch_scheduler_task: Optional[asyncio.Task] = None
+
+# Owner user, resolved once so notifications don't hit the REST API each time
+_owner_user: Optional[discord.User] = None
+
+async def get_owner() -> discord.User:
+    """Get the bot owner from cache, fetching from Discord only the first time."""
+    global _owner_user
+    if _owner_user is None:
+        owner_id = int(config.OWNER_ID)
+        _owner_user = bot.get_user(owner_id) or await bot.fetch_user(owner_id)
+    return _owner_user
+
+# Owner notifications are queued and sent in batches by _owner_notifier
+NOTIFY_BATCH_WINDOW = 0.5  # Seconds to wait for more embeds before sending
+NOTIFY_BATCH_SIZE = 10     # Discord allows at most 10 embeds per message
+_notify_queue: asyncio.Queue = asyncio.Queue()
+_notifier_task: Optional[asyncio.Task] = None
+
+# Owner-DM status message, edited in place only when its contents change
+_status_message: Optional[discord.Message] = None
+_last_status_hash: Optional[int] = None
+
+# ============================================================================
+# EMBED TEMPLATES
+# ============================================================================
+
+# Static parts of frequently used embeds, built once; handlers .copy() these
+_ACTIVE_COLOR = COLORS.get('active', discord.Color.blue())
+CONTROL_PANEL_TEMPLATE = discord.Embed(title="🎮 ComfyUI Control Panel", color=_ACTIVE_COLOR)
+LIST_ACCOUNTS_BASE = discord.Embed(title=f"{ICONS['credits']} Modal Accounts", color=COLORS['info'])
+_LIST_ACCOUNTS_DICT = LIST_ACCOUNTS_BASE.to_dict()  # For building the list in one from_dict
+STATUS_BASE = discord.Embed(title=f"{ICONS['info']} ComfyUI Status", color=COLORS['info'])
+
+# Account-row unpacking and status icons for the account list/select loops
+_ACCOUNT_FIELDS = operator.itemgetter('username', 'balance', 'status', 'is_active', 'selected_gpu')
+_STATUS_ICONS = {k: ICONS[k] for k in ('active', 'dead', 'ready', 'building')}
+
+# Account-select emoji by (is_active, below_threshold); other cases use the status icon
+_SELECT_EMOJI = {
+    (True, False): ICONS['active'],
+    (True, True): ICONS['active'],
+    (False, True): ICONS['dead'],
+}
+
+# Outputs under this size are sent from memory and kept in a small LRU keyed
+# on the remote (username, filename, size, mtime), so a repeat request for an
+# unchanged output skips both the volume download and the disk read
+SMALL_OUTPUT_MB = 1
+SMALL_OUTPUT_CACHE_SIZE = 32
+_small_outputs: "OrderedDict[tuple, bytes]" = OrderedDict()
 
 # ============================================================================
 # BOT EVENTS
@@ -79,7 +155,26 @@ async def on_ready():
         logger.error(f"Configuration error: {e}")
         sys.exit(1)
     
+    # Write any missing Modal profiles in one pass so later switches only activate
+    creds_list = [get_account_manager().get_decrypted_credentials(a['username']) for a in get_account_manager().get_all_accounts()]
+    await modal_manager.create_profiles([c for c in creds_list if c])
+    
+    # Connect to Modal in the background so the first command finds a live client
+    _schedule(modal_manager.warm_up())
+    
+    # Resolve the owner now so the first notification doesn't pay for it
+    try:
+        await get_owner()
+    except Exception as e:
+        logger.error(f"Failed to fetch owner user: {e}")
+    
     # Start background tasks
+    global _notifier_task, _switch_scheduler_task
+    if _notifier_task is None or _notifier_task.done():
+        _notifier_task = asyncio.create_task(_owner_notifier())
+    if _switch_scheduler_task is None or _switch_scheduler_task.done():
+        _switch_scheduler_task = asyncio.create_task(switch_scheduler())
+    
     if config.FEATURES['auto_credit_check']:
         credit_checker.start()
         logger.info("Credit checker task started")
@@ -116,7 +211,7 @@ async def credit_checker():
     logger.info("Running credit check...")
     
     try:
-        active_account = account_manager.get_active_account()
+        active_account = get_account_manager().get_active_account()
         
         if not active_account:
             logger.info("No active account, skipping credit check")
@@ -126,33 +221,98 @@ async def credit_checker():
         balance = await modal_manager.check_balance(active_account['username'])
         
         if balance is None:
-            logger.warning(f"Failed to check balance for {active_account['username']}")
+            logger.warning("Failed to check balance for %s", active_account['username'])
             return
         
-        logger.info(f"Account '{active_account['username']}' balance: ${balance:.2f}")
+        username = active_account['username']
+        below_threshold = balance < config.MIN_CREDIT_THRESHOLD
+        
+        # Nothing changed since the last tick - skip all Discord I/O
+        global _last_status_hash
+        new_hash = hash((username, round(balance, 2), below_threshold))
+        if new_hash == _last_status_hash:
+            return
+        _last_status_hash = new_hash
+        
+        logger.info("Account '%s' balance: $%.2f", username, balance)
+        await update_status_message(active_account, balance, below_threshold)
         
         # Check if below threshold
-        if balance < config.MIN_CREDIT_THRESHOLD:
-            logger.warning(f"Account '{active_account['username']}' below threshold!")
+        if below_threshold:
+            logger.warning("Account '%s' below threshold!", username)
             
-            # Check if we already sent a warning
-            username = active_account['username']
-            if username not in warning_sent:
-                # Send warning and start timer
+            # Only warn and set a deadline once per low-balance episode
+            if active_account['switch_at'] is None:
                 await send_low_balance_warning(active_account, balance)
-                warning_sent[username] = True
                 
                 # Start 20-minute countdown
-                asyncio.create_task(handle_auto_switch(active_account))
+                logger.info("Starting 20-minute countdown for account '%s'", username)
+                get_account_manager().set_switch_deadline(username, time.time() + config.SWITCH_WARNING_TIME)
+                _switch_wakeup.set()
+        
+        elif active_account['switch_at'] is not None:
+            # Balance recovered before the deadline - call off the switch
+            get_account_manager().set_switch_deadline(username, None)
+            _switch_wakeup.set()
+            logger.info("Balance recovered for '%s', auto-switch cancelled", username)
         
     except Exception as e:
-        logger.error(f"Error in credit checker: {e}")
+        logger.error("Error in credit checker: %s", e)
+
+async def update_status_message(account: dict, balance: float, below_threshold: bool):
+    """Edit the owner's status DM in place, sending it the first time."""
+    global _status_message
+    if not config.FEATURES['send_dm_alerts']:
+        return
+    
+    embed = discord.Embed(
+        title=f"{ICONS['info']} Bot Status",
+        color=COLORS['warning'] if below_threshold else COLORS['info']
+    )
+    embed.add_field(name="Active Account", value=account['username'], inline=True)
+    embed.add_field(name="Balance", value=f"{get_battery_icon(balance)} {format_currency(balance)}", inline=True)
+    
+    try:
+        if _status_message is not None:
+            try:
+                await _status_message.edit(embed=embed)
+                return
+            except discord.NotFound:
+                _status_message = None  # Deleted by the owner - send a fresh one
+        owner = await get_owner()
+        _status_message = await owner.send(embed=embed)
+    except Exception as e:
+        logger.error("Failed to update status message: %s", e)
+
+async def switch_scheduler():
+    """Run auto-switches as their persisted deadlines come due."""
+    while True:
+        try:
+            _switch_wakeup.clear()
+            deadlines = get_account_manager().get_switch_deadlines()
+            now = time.time()
+            
+            # Process everything that is due in one pass
+            for username, switch_at in deadlines.items():
+                if switch_at <= now:
+                    get_account_manager().set_switch_deadline(username, None)
+                    account = get_account_manager().get_account_by_username(username)
+                    if account:
+                        _schedule(handle_auto_switch(account))
+            
+            pending = [t for t in deadlines.values() if t > now]
+            timeout = min(pending) - now if pending else None
+            try:
+                await asyncio.wait_for(_switch_wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        except Exception as e:
+            logger.error("Error in switch scheduler: %s", e)
+            await asyncio.sleep(config.RETRY_DELAY)
 
 async def send_low_balance_warning(account: dict, balance: float):
     """Send low balance warning to owner."""
     try:
-        owner = await bot.fetch_user(int(config.OWNER_ID))
-        
         embed = discord.Embed(
             title=f"{ICONS['warning']} Low Balance Warning",
             description=MESSAGES['low_balance'].format(
@@ -174,35 +334,44 @@ async def send_low_balance_warning(account: dict, balance: float):
         )
         
         if config.FEATURES['send_dm_alerts']:
-            await owner.send(embed=embed)
-            logger.info("Sent low balance warning to owner")
+            _notify_queue.put_nowait(embed)
+            logger.info("Queued low balance warning for owner")
         
     except Exception as e:
-        logger.error(f"Failed to send warning: {e}")
+        logger.error("Failed to send warning: %s", e)
 
 async def handle_auto_switch(account: dict):
-    """Handle automatic account switching after 20 minute timer."""
+    """Handle automatic account switching once the 20 minute deadline passes."""
+    global _last_status_hash
     username = account['username']
-    logger.info(f"Starting 20-minute countdown for account '{username}'")
+    _last_status_hash = None  # Let the next credit check re-evaluate from scratch
     
-    # Wait 20 minutes
-    await asyncio.sleep(config.SWITCH_WARNING_TIME)
+    # The deadline may have raced a recovery or a manual switch - re-check
+    # before doing anything destructive
+    active = get_account_manager().get_active_account()
+    if not active or active['username'] != username:
+        logger.info("Account '%s' is no longer active, auto-switch dropped", username)
+        return
+    balance = await modal_manager.check_balance(username)
+    if balance is not None and balance >= config.MIN_CREDIT_THRESHOLD:
+        logger.info("Balance recovered for '%s' at the deadline, auto-switch dropped", username)
+        return
     
-    logger.info(f"Timer expired for '{username}', switching accounts...")
+    logger.info("Timer expired for '%s', switching accounts...", username)
     
     try:
         # Stop current ComfyUI
         await modal_manager.stop_comfyui()
-        logger.info(f"Stopped ComfyUI on '{username}'")
+        logger.info("Stopped ComfyUI on '%s'", username)
         
         # Update status
-        account_manager.update_status(username, 'dead')
+        get_account_manager().update_status(username, 'dead')
         
         # Find next available account
         success, msg, next_account = await modal_manager.switch_to_next_available_account()
         
         if not success:
-            logger.error(f"No available accounts to switch to: {msg}")
+            logger.error("No available accounts to switch to: %s", msg)
             await notify_owner(
                 "❌ No Available Accounts",
                 f"Failed to switch from `{username}`: {msg}\n\n"
@@ -222,12 +391,8 @@ async def handle_auto_switch(account: dict):
         # Start setup on new account
         await run_full_setup(next_account['username'])
         
-        # Clear warning flag
-        if username in warning_sent:
-            del warning_sent[username]
-        
     except Exception as e:
-        logger.error(f"Error during auto-switch: {e}")
+        logger.error("Error during auto-switch: %s", e)
         await notify_owner(
             "❌ Auto-Switch Failed",
             f"Error switching from `{username}`: {str(e)}",
@@ -236,7 +401,7 @@ async def handle_auto_switch(account: dict):
 
 async def run_full_setup(username: str):
     """Run complete setup (app1.py + app2.py) on an account."""
-    logger.info(f"Running full setup for '{username}'")
+    logger.info("Running full setup for '%s'", username)
     
     try:
         # Notify setup started
@@ -249,8 +414,12 @@ async def run_full_setup(username: str):
             COLORS['building']
         )
         
+        # Forward setup milestones to the owner as they happen
+        async def on_progress(line: str):
+            await notify_owner(f"{ICONS['building']} Setup Progress", f"`{username}`: {line}", COLORS['building'])
+        
         # Run complete setup (both app1.py and app2.py sequentially)
-        success, msg = await modal_manager.deploy_setup(username, gpu="T4")
+        success, msg = await modal_manager.deploy_setup(username, gpu="T4", on_progress=on_progress)
         
         if not success:
             await notify_owner(
@@ -260,7 +429,7 @@ async def run_full_setup(username: str):
             )
             return
         
-        logger.info(f"Setup completed for '{username}'")
+        logger.info("Setup completed for '%s'", username)
         
         # Notify completion
         await notify_owner(
@@ -273,7 +442,7 @@ async def run_full_setup(username: str):
         )
         
     except Exception as e:
-        logger.error(f"Error during setup for '{username}': {e}")
+        logger.error("Error during setup for '%s': %s", username, e)
         await notify_owner(
             "❌ Setup Failed",
             f"Account: `{username}`\nError: {str(e)}",
@@ -281,13 +450,267 @@ async def run_full_setup(username: str):
         )
 
 async def notify_owner(title: str, description: str, color: int):
-    """Send notification to bot owner."""
-    try:
-        owner = await bot.fetch_user(int(config.OWNER_ID))
-        embed = discord.Embed(title=title, description=description, color=color)
-        await owner.send(embed=embed)
-    except Exception as e:
-        logger.error(f"Failed to notify owner: {e}")
+    """Queue a notification for the bot owner."""
+    embed = discord.Embed(title=title, description=description, color=color)
+    _notify_queue.put_nowait(embed)
+
+async def _owner_notifier():
+    """Send queued owner notifications, coalescing bursts into one message."""
+    while True:
+        embeds = [await _notify_queue.get()]
+        
+        # Collect whatever else arrives within the batching window
+        while len(embeds) < NOTIFY_BATCH_SIZE:
+            try:
+                embeds.append(await asyncio.wait_for(_notify_queue.get(), timeout=NOTIFY_BATCH_WINDOW))
+            except asyncio.TimeoutError:
+                break
+        
+        await _send_owner_embeds(embeds)
+
+async def _send_owner_embeds(embeds: list):
+    """Send embeds to the owner in one DM, backing off on HTTP errors."""
+    delay = config.RETRY_DELAY
+    for attempt in range(1, config.MAX_RETRIES + 1):
+        try:
+            owner = await get_owner()
+            await owner.send(embeds=embeds)
+            return
+        except discord.HTTPException as e:
+            if attempt == config.MAX_RETRIES:
+                logger.error(f"Failed to notify owner after {attempt} attempts: {e}")
+                return
+            wait = getattr(e, 'retry_after', None) or delay
+            logger.warning(f"Owner notification failed ({e}), retrying in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay *= 2
+        except Exception as e:
+            logger.error(f"Failed to notify owner: {e}")
+            return
+
+# ============================================================================
+# UI COMPONENTS
+# ============================================================================
+
+class AddAccountModal(discord.ui.Modal):
+    """Popup form for adding a Modal account."""
+    
+    def __init__(self):
+        super().__init__(title="Add Modal Account")
+        
+        self.add_item(discord.ui.InputText(
+            label="Username",
+            placeholder="account_name",
+            required=True,
+            max_length=50
+        ))
+        
+        self.add_item(discord.ui.InputText(
+            label="Token ID",
+            placeholder="ak-xxxxxxxxxxxxx",
+            required=True,
+            max_length=100
+        ))
+        
+        self.add_item(discord.ui.InputText(
+            label="Token Secret",
+            placeholder="as-xxxxxxxxxxxxx",
+            required=True,
+            max_length=100
+        ))
+    
+    async def callback(self, interaction: discord.Interaction):
+        username = self.children[0].value
+        token_id = self.children[1].value
+        token_secret = self.children[2].value
+        
+        # Acknowledge now - profile creation can outlast the 3s window
+        await interaction.response.defer(ephemeral=True)
+        
+        # Add account
+        success, msg = get_account_manager().add_account(username, token_id, token_secret)
+        
+        if success:
+            # Create Modal profile
+            success2, msg2 = await modal_manager.create_profile(username, token_id, token_secret)
+            
+            if success2:
+                embed = discord.Embed(
+                    title=f"{ICONS['success']} Account Added",
+                    description=f"Account `{username}` added successfully!\n\n"
+                                f"Balance: {format_currency(config.INITIAL_BALANCE)}\n"
+                                f"Status: Ready",
+                    color=COLORS['success']
+                )
+                await interaction.followup.send(embed=embed, ephemeral=True)
+            else:
+                await interaction.followup.send(
+                    f"{ICONS['warning']} Account added to database but Modal profile creation failed: {msg2}",
+                    ephemeral=True
+                )
+        else:
+            await interaction.followup.send(
+                f"{ICONS['error']} {msg}",
+                ephemeral=True
+            )
+
+class AccountSelectView(discord.ui.View):
+    """Dropdown for manually switching the active account."""
+    
+    def __init__(self, accounts: list, active_username: Optional[str]):
+        super().__init__(timeout=60)
+        self.active_username = active_username
+        
+        # Create select menu options (checkmark on the active account)
+        threshold = config.MIN_CREDIT_THRESHOLD
+        options = [
+            discord.SelectOption(
+                label=f"{'✅ ' if username == active_username else ''}{username}",
+                value=username,
+                description=f"${balance:.2f} • {status.upper()}",
+                emoji=_SELECT_EMOJI.get((username == active_username, balance < threshold))
+                      or _STATUS_ICONS[status]
+            )
+            for username, balance, status, _, _ in map(_ACCOUNT_FIELDS, accounts)
+        ]
+        
+        select = discord.ui.Select(
+            placeholder="Select an account to switch to...",
+            options=options
+        )
+        select.callback = self.select_callback
+        self.add_item(select)
+    
+    async def select_callback(self, interaction: discord.Interaction):
+        selected_username = interaction.data['values'][0]
+        
+        # Check if already active
+        if selected_username == self.active_username:
+            await interaction.response.edit_message(
+                content=f"{ICONS['info']} Account `{selected_username}` is already active!",
+                view=None,
+                embed=None
+            )
+            return
+        
+        await interaction.response.edit_message(
+            content=f"{ICONS['loading']} Switching to account `{selected_username}`...",
+            view=None,
+            embed=None
+        )
+        
+        # Switch account
+        success, msg = await modal_manager.switch_to_account(selected_username)
+        
+        if success:
+            embed = discord.Embed(
+                title=f"{ICONS['switching']} Account Switched",
+                description=f"Successfully switched to `{selected_username}`",
+                color=COLORS['success']
+            )
+            await interaction.edit_original_response(content=None, embed=embed)
+        else:
+            await interaction.edit_original_response(
+                content=f"{ICONS['error']} {msg}",
+                embed=None
+            )
+
+class GPUSelect(discord.ui.Select):
+    """GPU picker for starting on a specific GPU (the panel's Start uses the saved one)."""
+    
+    def __init__(self, username: str):
+        from ui_config import GPU_OPTIONS
+        
+        options = []
+        for gpu in GPU_OPTIONS:
+            options.append(discord.SelectOption(
+                label=f"{gpu['name']} - ${gpu['price']}/h",
+                value=gpu['name'],
+                emoji=gpu['emoji'],
+                description=f"${gpu['price']} per hour"
+            ))
+        
+        super().__init__(placeholder="Start on GPU...", options=options, row=3)
+        self.username = username
+    
+    async def callback(self, interaction: discord.Interaction):
+        selected_gpu = self.values[0]
+        
+        await interaction.response.send_message(
+            f"{ICONS['loading']} Starting ComfyUI on {selected_gpu}..."
+        )
+        
+        # Start ComfyUI
+        success, msg = await modal_manager.start_comfyui(self.username, selected_gpu)
+        
+        if success:
+            jupyter_url = config.CLOUDFLARE_URLS['jupyter']
+            comfyui_url = config.CLOUDFLARE_URLS['comfyui']
+            
+            embed = discord.Embed(
+                title=f"{ICONS['success']} ComfyUI Started!",
+                description=MESSAGES['comfy_started'].format(
+                    icon=ICONS['success'],
+                    jupyter=ICONS['success'],
+                    jupyter_url=jupyter_url,
+                    comfy=ICONS['success'],
+                    comfy_url=comfyui_url
+                ),
+                color=COLORS['success']
+            )
+            embed.add_field(name="GPU", value=selected_gpu, inline=True)
+            embed.add_field(name="Account", value=self.username, inline=True)
+            
+            await interaction.edit_original_response(content=None, embed=embed)
+        else:
+            await interaction.edit_original_response(
+                content=f"{ICONS['error']} {msg}",
+                embed=None
+            )
+
+class GenerateModal(discord.ui.Modal):
+    """Popup form for running a workflow with a prompt."""
+    
+    def __init__(self):
+        super().__init__(title="Generate Image")
+        
+        self.add_item(discord.ui.InputText(
+            label="Workflow Name",
+            placeholder="seedream",
+            required=True,
+            max_length=50
+        ))
+        
+        self.add_item(discord.ui.InputText(
+            label="Prompt",
+            placeholder="a beautiful sunset over mountains",
+            required=True,
+            style=discord.InputTextStyle.paragraph,
+            max_length=1000
+        ))
+    
+    async def callback(self, interaction: discord.Interaction):
+        workflow_name = self.children[0].value
+        prompt = self.children[1].value
+        
+        await interaction.response.defer()
+        
+        # Generate
+        success, msg, response = await workflow_manager.generate_with_workflow(workflow_name, prompt)
+        
+        if success:
+            embed = discord.Embed(
+                title=f"{ICONS['loading']} Generating...",
+                description=f"Workflow: `{workflow_name}`\n"
+                            f"Prompt: {prompt[:100]}...",
+                color=COLORS['progress']
+            )
+            await interaction.followup.send(embed=embed)
+            
+            # Note: In real implementation, you'd need to poll ComfyUI
+            # for completion and then download the output
+        else:
+            await interaction.followup.send(f"{ICONS['error']} {msg}", ephemeral=True)
 
 # ============================================================================
 # MODAL MANAGEMENT COMMANDS
@@ -298,71 +721,13 @@ async def add_account(ctx: discord.ApplicationContext):
     """Add a new Modal account via popup form."""
     
     # Check if max accounts reached
-    if account_manager.get_account_count() >= config.MAX_ACCOUNTS:
+    if get_account_manager().get_account_count() >= config.MAX_ACCOUNTS:
         await ctx.respond(
             f"{ICONS['error']} Maximum account limit reached ({config.MAX_ACCOUNTS} accounts).",
             ephemeral=True
         )
         return
     
-    # Create modal popup
-    class AddAccountModal(discord.ui.Modal):
-        def __init__(self):
-            super().__init__(title="Add Modal Account")
-            
-            self.add_item(discord.ui.InputText(
-                label="Username",
-                placeholder="account_name",
-                required=True,
-                max_length=50
-            ))
-            
-            self.add_item(discord.ui.InputText(
-                label="Token ID",
-                placeholder="ak-xxxxxxxxxxxxx",
-                required=True,
-                max_length=100
-            ))
-            
-            self.add_item(discord.ui.InputText(
-                label="Token Secret",
-                placeholder="as-xxxxxxxxxxxxx",
-                required=True,
-                max_length=100
-            ))
-        
-        async def callback(self, interaction: discord.Interaction):
-            username = self.children[0].value
-            token_id = self.children[1].value
-            token_secret = self.children[2].value
-            
-            # Add account
-            success, msg = account_manager.add_account(username, token_id, token_secret)
-            
-            if success:
-                # Create Modal profile
-                success2, msg2 = await modal_manager.create_profile(username, token_id, token_secret)
-                
-                if success2:
-                    embed = discord.Embed(
-                        title=f"{ICONS['success']} Account Added",
-                        description=f"Account `{username}` added successfully!\n\n"
-                                    f"Balance: {format_currency(config.INITIAL_BALANCE)}\n"
-                                    f"Status: Ready",
-                        color=COLORS['success']
-                    )
-                    await interaction.response.send_message(embed=embed, ephemeral=True)
-                else:
-                    await interaction.response.send_message(
-                        f"{ICONS['warning']} Account added to database but Modal profile creation failed: {msg2}",
-                        ephemeral=True
-                    )
-            else:
-                await interaction.response.send_message(
-                    f"{ICONS['error']} {msg}",
-                    ephemeral=True
-                )
-    
     await ctx.send_modal(AddAccountModal())
 
 @bot.slash_command(name="list_accounts", description="View all Modal accounts")
@@ -370,27 +735,18 @@ async def list_accounts(ctx: discord.ApplicationContext):
     """List all Modal accounts with balances."""
     await ctx.defer()
     
-    accounts = account_manager.get_all_accounts()
+    accounts = get_account_manager().get_all_accounts()
     
     if not accounts:
         await ctx.respond("No accounts found. Use `/add_account` to add one!", ephemeral=True)
         return
     
-    # Create embed
-    embed = discord.Embed(
-        title=f"{ICONS['credits']} Modal Accounts",
-        color=COLORS['info']
-    )
-    
-    for account in accounts:
-        username = account['username']
-        balance = account['balance']
-        status = account['status']
-        is_active = account['is_active']
-        selected_gpu = account['selected_gpu'] or 'Not set'
+    fields = []
+    for username, balance, status, is_active, selected_gpu in map(_ACCOUNT_FIELDS, accounts):
+        selected_gpu = selected_gpu or 'Not set'
         
         # Get status icon and color
-        status_icon = ICONS['active'] if is_active else ICONS[status]
+        status_icon = _STATUS_ICONS['active'] if is_active else _STATUS_ICONS[status]
         battery = get_battery_icon(balance)
         
         # Format status text
@@ -402,11 +758,15 @@ async def list_accounts(ctx: discord.ApplicationContext):
             f"{ICONS['gpu']} GPU: {selected_gpu}"
         )
         
-        embed.add_field(name=username, value=value, inline=True)
+        fields.append({"name": username, "value": value, "inline": True})
     
-    # Add total balance
-    total = account_manager.get_total_balance()
-    embed.set_footer(text=f"Total Balance: {format_currency(total)}")
+    # Build the embed in one pass, with the total balance in the footer
+    total = get_account_manager().get_total_balance()
+    embed = discord.Embed.from_dict({
+        **_LIST_ACCOUNTS_DICT,
+        "fields": fields,
+        "footer": {"text": f"Total Balance: {format_currency(total)}"}
+    })
     
     await ctx.respond(embed=embed)
 
@@ -415,90 +775,17 @@ async def switch_account(ctx: discord.ApplicationContext):
     """Manually switch to a different account using a dropdown menu."""
     
     # Get all accounts
-    accounts = account_manager.get_all_accounts()
+    accounts = get_account_manager().get_all_accounts()
     
     if not accounts:
         await ctx.respond("No accounts found. Use `/add_account` to add one!", ephemeral=True)
         return
     
     # Get currently active account
-    active_account = account_manager.get_active_account()
+    active_account = get_account_manager().get_active_account()
     active_username = active_account['username'] if active_account else None
     
-    # Create dropdown menu view
-    class AccountSelectView(discord.ui.View):
-        def __init__(self):
-            super().__init__(timeout=60)
-            
-            # Create select menu options
-            options = []
-            for account in accounts:
-                username = account['username']
-                balance = account['balance']
-                status = account['status']
-                
-                # Add checkmark for active account
-                label = f"{'✅ ' if username == active_username else ''}{username}"
-                
-                # Status emoji
-                if username == active_username:
-                    emoji = ICONS['active']
-                elif balance < config.MIN_CREDIT_THRESHOLD:
-                    emoji = ICONS['dead']
-                else:
-                    emoji = ICONS[status]
-                
-                description = f"${balance:.2f} • {status.upper()}"
-                
-                options.append(discord.SelectOption(
-                    label=label,
-                    value=username,
-                    description=description,
-                    emoji=emoji
-                ))
-            
-            select = discord.ui.Select(
-                placeholder="Select an account to switch to...",
-                options=options
-            )
-            select.callback = self.select_callback
-            self.add_item(select)
-        
-        async def select_callback(self, interaction: discord.Interaction):
-            selected_username = interaction.data['values'][0]
-            
-            # Check if already active
-            if selected_username == active_username:
-                await interaction.response.edit_message(
-                    content=f"{ICONS['info']} Account `{selected_username}` is already active!",
-                    view=None,
-                    embed=None
-                )
-                return
-            
-            await interaction.response.edit_message(
-                content=f"{ICONS['loading']} Switching to account `{selected_username}`...",
-                view=None,
-                embed=None
-            )
-            
-            # Switch account
-            success, msg = await modal_manager.switch_to_account(selected_username)
-            
-            if success:
-                embed = discord.Embed(
-                    title=f"{ICONS['switching']} Account Switched",
-                    description=f"Successfully switched to `{selected_username}`",
-                    color=COLORS['success']
-                )
-                await interaction.edit_original_response(content=None, embed=embed)
-            else:
-                await interaction.edit_original_response(
-                    content=f"{ICONS['error']} {msg}",
-                    embed=None
-                )
-    
-    view = AccountSelectView()
+    view = AccountSelectView(accounts, active_username)
     embed = discord.Embed(
         title=f"{ICONS['switching']} Switch Account",
         description=f"Currently active: `{active_username or 'None'}`\n\nSelect an account from the dropdown below:",
@@ -534,7 +821,7 @@ async def check_balance(ctx: discord.ApplicationContext):
     
     for username, balance in balances.items():
         battery = get_battery_icon(balance)
-        account = account_manager.get_account_by_username(username)
+        account = get_account_manager().get_account_by_username(username)
         status_icon = ICONS[account['status']]
         
         embed.add_field(
@@ -557,7 +844,7 @@ async def start_comfyui(ctx: discord.ApplicationContext):
     """Open the main control panel with buttons."""
     
     # Check if there's an active account
-    active_account = account_manager.get_active_account()
+    active_account = get_account_manager().get_active_account()
     
     if not active_account:
         await ctx.respond(
@@ -569,14 +856,11 @@ async def start_comfyui(ctx: discord.ApplicationContext):
         return
     
     username = active_account['username']
-    status = active_account.get('status', 'unknown')
+    status = active_account['status'] or 'unknown'
     
     # Create embed with current status
-    embed = discord.Embed(
-        title="🎮 ComfyUI Control Panel",
-        description=f"**Account:** `{username}`\n**Status:** {status.upper()}",
-        color=COLORS.get('active', discord.Color.blue())
-    )
+    embed = CONTROL_PANEL_TEMPLATE.copy()
+    embed.description = f"**Account:** `{username}`\n**Status:** {status.upper()}"
     
     # Add server info if running
     if modal_manager.current_deployment:
@@ -597,78 +881,10 @@ async def start_comfyui(ctx: discord.ApplicationContext):
             inline=False
         )
     
-    await ctx.respond(embed=embed, view=MainControlPanel(bot), ephemeral=False)
-    
-    # Create GPU selection view
-    class GPUSelectView(discord.ui.View):
-        def __init__(self):
-            super().__init__(timeout=60)
-            
-            # Create select menu
-            from ui_config import GPU_OPTIONS
-            
-            options = []
-            for gpu in GPU_OPTIONS:
-                options.append(discord.SelectOption(
-                    label=f"{gpu['name']} - ${gpu['price']}/h",
-                    value=gpu['name'],
-                    emoji=gpu['emoji'],
-                    description=f"${gpu['price']} per hour"
-                ))
-            
-            select = discord.ui.Select(
-                placeholder="Select GPU...",
-                options=options
-            )
-            select.callback = self.select_callback
-            self.add_item(select)
-            self.selected_gpu = None
-        
-        async def select_callback(self, interaction: discord.Interaction):
-            self.selected_gpu = interaction.data['values'][0]
-            
-            await interaction.response.edit_message(
-                content=f"{ICONS['loading']} Starting ComfyUI on {self.selected_gpu}...",
-                view=None
-            )
-            
-            # Start ComfyUI
-            success, msg = await modal_manager.start_comfyui(active_account['username'], self.selected_gpu)
-            
-            if success:
-                jupyter_url = config.CLOUDFLARE_URLS['jupyter']
-                comfyui_url = config.CLOUDFLARE_URLS['comfyui']
-                
-                embed = discord.Embed(
-                    title=f"{ICONS['success']} ComfyUI Started!",
-                    description=MESSAGES['comfy_started'].format(
-                        icon=ICONS['success'],
-                        jupyter=ICONS['success'],
-                        jupyter_url=jupyter_url,
-                        comfy=ICONS['success'],
-                        comfy_url=comfyui_url
-                    ),
-                    color=COLORS['success']
-                )
-                embed.add_field(name="GPU", value=self.selected_gpu, inline=True)
-                embed.add_field(name="Account", value=active_account['username'], inline=True)
-                
-                await interaction.edit_original_response(content=None, embed=embed)
-            else:
-                await interaction.edit_original_response(
-                    content=f"{ICONS['error']} {msg}",
-                    embed=None
-                )
-    
-    view = GPUSelectView()
-    embed = discord.Embed(
-        title=f"{ICONS['gpu']} Select GPU",
-        description=f"Account: `{active_account['username']}`\n\n"
-                    "Choose a GPU to start ComfyUI:",
-        color=COLORS['info']
-    )
-    
-    await ctx.respond(embed=embed, view=view)
+    # One response: control panel buttons with the GPU picker on the last row
+    view = MainControlPanel(bot)
+    view.add_item(GPUSelect(username))
+    await ctx.respond(embed=embed, view=view, ephemeral=False)
 
 @bot.slash_command(name="stop", description="Stop ComfyUI")
 async def stop_comfyui(ctx: discord.ApplicationContext):
@@ -692,16 +908,13 @@ async def status(ctx: discord.ApplicationContext):
     """Check current ComfyUI status."""
     await ctx.defer()
     
-    active_account = account_manager.get_active_account()
+    active_account = get_account_manager().get_active_account()
     
     if not active_account:
         await ctx.respond("No active account.", ephemeral=True)
         return
     
-    embed = discord.Embed(
-        title=f"{ICONS['info']} ComfyUI Status",
-        color=COLORS['info']
-    )
+    embed = STATUS_BASE.copy()
     
     embed.add_field(name="Active Account", value=active_account['username'], inline=True)
     embed.add_field(name="Balance", value=format_currency(active_account['balance']), inline=True)
@@ -734,49 +947,6 @@ async def status(ctx: discord.ApplicationContext):
 async def generate(ctx: discord.ApplicationContext):
     """Generate an image using a workflow."""
     
-    # Create modal for generation
-    class GenerateModal(discord.ui.Modal):
-        def __init__(self):
-            super().__init__(title="Generate Image")
-            
-            self.add_item(discord.ui.InputText(
-                label="Workflow Name",
-                placeholder="seedream",
-                required=True,
-                max_length=50
-            ))
-            
-            self.add_item(discord.ui.InputText(
-                label="Prompt",
-                placeholder="a beautiful sunset over mountains",
-                required=True,
-                style=discord.InputTextStyle.paragraph,
-                max_length=1000
-            ))
-        
-        async def callback(self, interaction: discord.Interaction):
-            workflow_name = self.children[0].value
-            prompt = self.children[1].value
-            
-            await interaction.response.defer()
-            
-            # Generate
-            success, msg, response = await workflow_manager.generate_with_workflow(workflow_name, prompt)
-            
-            if success:
-                embed = discord.Embed(
-                    title=f"{ICONS['loading']} Generating...",
-                    description=f"Workflow: `{workflow_name}`\n"
-                                f"Prompt: {prompt[:100]}...",
-                    color=COLORS['progress']
-                )
-                await interaction.followup.send(embed=embed)
-                
-                # Note: In real implementation, you'd need to poll ComfyUI
-                # for completion and then download the output
-            else:
-                await interaction.followup.send(f"{ICONS['error']} {msg}", ephemeral=True)
-    
     await ctx.send_modal(GenerateModal())
 
 @bot.slash_command(name="list_outputs", description="List generated outputs")
@@ -812,6 +982,20 @@ async def get_output(ctx: discord.ApplicationContext, filename: str):
     """Download an output file."""
     await ctx.defer()
     
+    # Serve an unchanged small output straight from memory
+    active = get_account_manager().get_active_account()
+    cache_key = None
+    if active:
+        remote_path = f"{config.MODAL_PATHS['outputs']}/{filename}"
+        stat = await modal_manager.stat_volume_file(active['username'], remote_path)
+        if stat is not None:
+            cache_key = (active['username'], filename, *stat)
+    data = _small_outputs.get(cache_key) if cache_key else None
+    if data is not None:
+        _small_outputs.move_to_end(cache_key)
+        await ctx.respond(file=discord.File(io.BytesIO(data), filename=filename))
+        return
+    
     # Download file
     file_path = await modal_manager.get_output_file(filename)
     
@@ -819,8 +1003,8 @@ async def get_output(ctx: discord.ApplicationContext, filename: str):
         await ctx.respond(f"{ICONS['error']} File not found: {filename}", ephemeral=True)
         return
     
-    # Check size
-    size_mb = utils.get_file_size_mb(file_path)
+    # Check size (stat and open run in a worker thread, off the event loop)
+    size_mb = await asyncio.to_thread(utils.get_file_size_mb, file_path)
     if size_mb > config.MAX_DISCORD_FILE_SIZE:
         await ctx.respond(
             f"{ICONS['error']} File too large: {size_mb:.1f}MB (max: {config.MAX_DISCORD_FILE_SIZE}MB)",
@@ -830,7 +1014,15 @@ async def get_output(ctx: discord.ApplicationContext, filename: str):
     
     # Send file
     try:
-        file = discord.File(file_path)
+        if size_mb < SMALL_OUTPUT_MB:
+            data = await asyncio.to_thread(file_path.read_bytes)
+            if cache_key:
+                _small_outputs[cache_key] = data
+                while len(_small_outputs) > SMALL_OUTPUT_CACHE_SIZE:
+                    _small_outputs.popitem(last=False)
+            file = discord.File(io.BytesIO(data), filename=file_path.name)
+        else:
+            file = await asyncio.to_thread(discord.File, file_path)
         await ctx.respond(file=file)
     except Exception as e:
         logger.error(f"Failed to send file: {e}")
@@ -845,7 +1037,7 @@ async def setup(ctx: discord.ApplicationContext):
     """Run full setup (step 1 + step 2) on the active account."""
     await ctx.defer()
     
-    active_account = account_manager.get_active_account()
+    active_account = get_account_manager().get_active_account()
     
     if not active_account:
         await ctx.respond(
@@ -866,7 +1058,7 @@ async def setup(ctx: discord.ApplicationContext):
     await ctx.respond(embed=embed)
     
     # Run setup in background
-    asyncio.create_task(run_full_setup(active_account['username']))
+    _schedule(run_full_setup(active_account['username']))
 
 # ============================================================================
 # ADMIN COMMANDS
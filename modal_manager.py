@@ -9,16 +9,52 @@ Handles all Modal.com operations:
 - Volume operations
 """
 
+import os
+import re
+import glob
+import json
 import logging
 import asyncio
-from typing import Optional, Dict, Any, Tuple
-from pathlib import Path
+import time
+from typing import Optional, Dict, Any, Tuple, Callable, Awaitable
+from pathlib import Path, PurePosixPath
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python 3.10
+    import tomli as tomllib
+import tomli_w
+
+import modal
 import config
 import utils
-from account_manager import account_manager
+from account_manager import get_account_manager
 
 logger = logging.getLogger(__name__)
 
+# Concurrent balance checks; keeps Modal CLI/API load bounded
+BALANCE_CHECK_CONCURRENCY = 4
+
+# Seconds a fetched balance is reused before the Modal CLI is spawned again
+BALANCE_CACHE_TTL = 60
+
+# Seconds a workflow/output directory listing is reused
+LISTING_CACHE_TTL = 30
+
+# Setup output lines worth forwarding as progress (milestones and failures
+# printed by app1.py / app2.py)
+SETUP_PROGRESS_MARKERS = ('✅', 'Cloning ComfyUI', 'Downloading models', 'Installing', 'failed', 'incomplete')
+
+# Volume downloads are handed to a worker thread in batches of at least this size
+DOWNLOAD_WRITE_BYTES = 1 << 20
+
+# On-disk cache of downloaded workflows, keyed by (name, remote size, remote mtime)
+WORKFLOW_CACHE_DIR = config.TEMP_DIR / "workflow_cache"
+WORKFLOW_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Modern Modal CLI (v0.63+) keeps profiles in ~/.modal.toml
+MODAL_CONFIG_PATH = Path.home() / ".modal.toml"
+
 # ============================================================================
 # MODAL MANAGER CLASS
 # ============================================================================
@@ -29,6 +65,44 @@ class ModalManager:
     def __init__(self):
         """Initialize Modal manager."""
         self.current_deployment = None  # Track current deployment info
+        self._run_task: Optional[asyncio.Task] = None  # Local `modal run` for the deployment
+        self._balance_cache: Dict[str, Tuple[float, float]] = {}  # username -> (fetched_at, balance)
+        self._clients: Dict[str, modal.Client] = {}  # username -> authenticated SDK client
+        self._volumes: Dict[str, modal.Volume] = {}  # username -> data volume handle
+        self._listing_cache: Dict[Tuple[str, str], Tuple[float, list]] = {}  # (username, path) -> (ts, files)
+        self._toml_cache: Optional[Dict[str, Any]] = None  # Parsed .modal.toml
+        self._toml_mtime: Optional[int] = None  # mtime_ns the cache was read at
+        self._toml_lock = asyncio.Lock()
+    
+    def _load_modal_toml(self) -> Dict[str, Any]:
+        """
+        Get .modal.toml as a dict, re-reading only when the file changed.
+        
+        The Modal CLI rewrites the file itself (e.g. on profile activate),
+        so the cache is keyed on mtime rather than trusted forever.
+        """
+        try:
+            mtime = MODAL_CONFIG_PATH.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._toml_cache, self._toml_mtime = {}, None
+            return self._toml_cache
+        
+        if self._toml_cache is None or mtime != self._toml_mtime:
+            self._toml_cache = tomllib.loads(MODAL_CONFIG_PATH.read_text())
+            self._toml_mtime = mtime
+        return self._toml_cache
+    
+    def _write_modal_toml(self, data: Dict[str, Any]):
+        """Atomically replace .modal.toml (temp file + os.replace)."""
+        tmp_path = MODAL_CONFIG_PATH.with_suffix('.toml.tmp')
+        # Holds token secrets, so the file is owner-only from the moment it exists
+        tmp_path.unlink(missing_ok=True)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(tomli_w.dumps(data))
+        os.replace(tmp_path, MODAL_CONFIG_PATH)
+        self._toml_cache = data
+        self._toml_mtime = MODAL_CONFIG_PATH.stat().st_mtime_ns
     
     # ========================================================================
     # PROFILE MANAGEMENT
@@ -48,39 +122,25 @@ class ModalManager:
         """
         logger.info(f"Creating Modal profile: {username}")
         
-        # Modern Modal CLI (v0.63+) uses ~/.modal.toml for profile management
-        # We need to add the profile to the .modal.toml file
-        from pathlib import Path
-        import os
-        
-        modal_config_path = Path.home() / ".modal.toml"
-        
         try:
-            # Read existing config or create empty string
-            if modal_config_path.exists():
-                with open(modal_config_path, 'r') as f:
-                    config_content = f.read()
-            else:
-                config_content = ""
+            async with self._toml_lock:
+                profiles = await asyncio.to_thread(self._load_modal_toml)
+                exists = username in profiles
+                
+                if not exists:
+                    # Add new profile section and rewrite the file atomically
+                    updated = dict(profiles)
+                    updated[username] = {'token_id': token_id, 'token_secret': token_secret}
+                    await asyncio.to_thread(self._write_modal_toml, updated)
+                    logger.info(f"Added profile '{username}' to .modal.toml")
             
             # Check if profile already exists
-            if f"[{username}]" in config_content:
+            if exists:
                 logger.info(f"Profile '{username}' already exists in .modal.toml")
                 # Just activate it
                 success, msg = await self.activate_profile(username)
                 return success, msg if success else f"Profile exists but failed to activate: {msg}"
             
-            # Add new profile section
-            new_profile = f"\n[{username}]\n"
-            new_profile += f'token_id = "{token_id}"\n'
-            new_profile += f'token_secret = "{token_secret}"\n'
-            
-            # Write updated config
-            with open(modal_config_path, 'a') as f:
-                f.write(new_profile)
-            
-            logger.info(f"Added profile '{username}' to .modal.toml")
-            
             # Activate the new profile
             success, msg = await self.activate_profile(username)
             if not success:
@@ -94,10 +154,45 @@ class ModalManager:
             logger.error(error_msg)
             return False, error_msg
     
+    async def create_profiles(self, creds_list: list[Dict[str, str]]) -> Tuple[bool, str]:
+        """
+        Add several Modal profiles to ~/.modal.toml in a single rewrite.
+        
+        Profiles that already exist are left alone and nothing is activated;
+        switch_to_account activates the one it needs.
+        
+        Args:
+            creds_list: Dicts with 'username', 'token_id' and 'token_secret'
+                (as returned by get_decrypted_credentials)
+        
+        Returns:
+            (success, message)
+        """
+        try:
+            async with self._toml_lock:
+                profiles = await asyncio.to_thread(self._load_modal_toml)
+                missing = [c for c in creds_list if c['username'] not in profiles]
+                
+                if missing:
+                    updated = dict(profiles)
+                    for creds in missing:
+                        updated[creds['username']] = {'token_id': creds['token_id'], 'token_secret': creds['token_secret']}
+                    await asyncio.to_thread(self._write_modal_toml, updated)
+        except Exception as e:
+            error_msg = f"Failed to create profiles: {e}"
+            logger.error(error_msg)
+            return False, error_msg
+        
+        logger.info(f"Added {len(missing)} profile(s) to .modal.toml")
+        return True, f"Added {len(missing)} profile(s)"
+    
     async def activate_profile(self, username: str) -> Tuple[bool, str]:
         """
         Activate a Modal profile (switch to it).
         
+        Marks the profile `active = true` in .modal.toml in-process, which is
+        what `modal profile activate` does, without spawning the CLI.
+        
         Args:
             username: Profile name to activate
         
@@ -106,11 +201,22 @@ class ModalManager:
         """
         logger.info(f"Activating Modal profile: {username}")
         
-        command = config.get_modal_command('profile_activate', profile_name=username)
-        return_code, stdout, stderr = await utils.run_command(command)
-        
-        if return_code != 0:
-            error_msg = f"Failed to activate profile: {stderr}"
+        try:
+            async with self._toml_lock:
+                profiles = await asyncio.to_thread(self._load_modal_toml)
+                if username not in profiles:
+                    error_msg = f"Failed to activate profile: '{username}' not found in .modal.toml"
+                    logger.error(error_msg)
+                    return False, error_msg
+                
+                updated = {
+                    name: {key: value for key, value in settings.items() if key != 'active'}
+                    for name, settings in profiles.items()
+                }
+                updated[username]['active'] = True
+                await asyncio.to_thread(self._write_modal_toml, updated)
+        except Exception as e:
+            error_msg = f"Failed to activate profile: {e}"
             logger.error(error_msg)
             return False, error_msg
         
@@ -119,21 +225,25 @@ class ModalManager:
     
     async def get_current_profile(self) -> Optional[str]:
         """
-        Get the currently active Modal profile.
+        Get the currently active Modal profile, resolved the way the CLI does:
+        MODAL_PROFILE, then the profile marked active, then a lone profile.
         
         Returns:
             Profile name or None if failed
         """
-        command = config.get_modal_command('profile_current')
-        return_code, stdout, stderr = await utils.run_command(command)
+        if os.environ.get('MODAL_PROFILE'):
+            return os.environ['MODAL_PROFILE']
         
-        if return_code != 0:
-            logger.error(f"Failed to get current profile: {stderr}")
+        try:
+            profiles = await asyncio.to_thread(self._load_modal_toml)
+        except Exception as e:
+            logger.error(f"Failed to get current profile: {e}")
             return None
         
-        # Parse output to get profile name
-        profile_name = stdout.strip()
-        return profile_name if profile_name else None
+        for name, settings in profiles.items():
+            if settings.get('active'):
+                return name
+        return next(iter(profiles)) if len(profiles) == 1 else None
     
     async def list_profiles(self) -> list[str]:
         """
@@ -142,16 +252,143 @@ class ModalManager:
         Returns:
             List of profile names
         """
-        command = config.get_modal_command('profile_list')
-        return_code, stdout, stderr = await utils.run_command(command)
+        try:
+            return list(await asyncio.to_thread(self._load_modal_toml))
+        except Exception as e:
+            logger.error(f"Failed to list profiles: {e}")
+            return []
+    
+    # ========================================================================
+    # MODAL SDK (in-process, one authenticated client per account)
+    # ========================================================================
+    
+    async def _get_volume(self, username: str) -> modal.Volume:
+        """Get an account's data volume, creating its SDK client on first use."""
+        volume = self._volumes.get(username)
+        if volume is not None:
+            return volume
+        
+        client = self._clients.get(username)
+        if client is None:
+            creds = get_account_manager().get_decrypted_credentials(username)
+            if not creds:
+                raise RuntimeError(f"No credentials for account '{username}'")
+            client = await modal.Client.from_credentials.aio(creds['token_id'], creds['token_secret'])
+            self._clients[username] = client
+        
+        volume = await modal.Volume.lookup.aio(config.MODAL_VOLUME_NAME, client=client)
+        self._volumes[username] = volume
+        return volume
+    
+    async def warm_up(self):
+        """
+        Open the active account's SDK client and volume handle ahead of time,
+        so the first command after startup doesn't pay for the connection.
+        """
+        active = get_account_manager().get_active_account()
+        if not active:
+            return
+        try:
+            await self._get_volume(active['username'])
+            logger.info(f"Modal client ready for '{active['username']}'")
+        except Exception as e:
+            logger.warning(f"Modal warm-up failed for '{active['username']}': {e}")
+    
+    async def read_volume_file(self, username: str, remote_path: str) -> Optional[bytes]:
+        """
+        Read a file from an account's volume through the SDK.
         
-        if return_code != 0:
-            logger.error(f"Failed to list profiles: {stderr}")
+        Returns:
+            File contents or None if failed
+        """
+        try:
+            volume = await self._get_volume(username)
+            return b''.join([chunk async for chunk in volume.read_file.aio(remote_path)])
+        except Exception as e:
+            logger.error(f"Failed to read {remote_path} for '{username}': {e}")
+            return None
+    
+    async def download_volume_file(self, username: str, remote_path: str, local_path: Path) -> bool:
+        """
+        Stream a file from an account's volume to local disk through the SDK.
+        
+        The SDK yields small network chunks; they are gathered into
+        DOWNLOAD_WRITE_BYTES batches and written from a worker thread, so a
+        large video costs a few big writes and never blocks the event loop.
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        utils.ensure_directory(local_path.parent)
+        try:
+            volume = await self._get_volume(username)
+            f = await asyncio.to_thread(open, local_path, 'wb')
+            try:
+                pending, pending_bytes = [], 0
+                async for chunk in volume.read_file.aio(remote_path):
+                    pending.append(chunk)
+                    pending_bytes += len(chunk)
+                    if pending_bytes >= DOWNLOAD_WRITE_BYTES:
+                        await asyncio.to_thread(f.writelines, pending)
+                        pending, pending_bytes = [], 0
+                if pending:
+                    await asyncio.to_thread(f.writelines, pending)
+            finally:
+                await asyncio.to_thread(f.close)
+        except Exception as e:
+            logger.error(f"Failed to download {remote_path} for '{username}': {e}")
+            local_path.unlink(missing_ok=True)
+            return False
+        return True
+    
+    async def list_volume_files(self, username: str, remote_path: str) -> list[str]:
+        """
+        List file names in a directory of an account's volume through the SDK.
+        
+        Listings are reused for LISTING_CACHE_TTL seconds; call
+        invalidate_listings() after anything that changes the volume.
+        
+        Returns:
+            List of filenames
+        """
+        key = (username, remote_path)
+        cached = self._listing_cache.get(key)
+        if cached and time.monotonic() - cached[0] < LISTING_CACHE_TTL:
+            return list(cached[1])
+        
+        try:
+            volume = await self._get_volume(username)
+            entries = await volume.listdir.aio(remote_path)
+            files = [PurePosixPath(entry.path).name for entry in entries]
+        except Exception as e:
+            logger.error(f"Failed to list {remote_path} for '{username}': {e}")
             return []
         
-        # Parse output (each line is a profile name)
-        profiles = [line.strip() for line in stdout.split('\n') if line.strip()]
-        return profiles
+        self._listing_cache[key] = (time.monotonic(), files)
+        return list(files)
+    
+    async def stat_volume_file(self, username: str, remote_path: str) -> Optional[Tuple[int, int]]:
+        """
+        Get (size, mtime) of a file on an account's volume without downloading it.
+        
+        Returns:
+            (size, mtime) or None if failed
+        """
+        try:
+            volume = await self._get_volume(username)
+            entries = await volume.listdir.aio(remote_path)  # A file path lists just that file
+        except Exception as e:
+            logger.error(f"Failed to stat {remote_path} for '{username}': {e}")
+            return None
+        return (entries[0].size, entries[0].mtime) if entries else None
+    
+    def invalidate_listings(self, remote_path: Optional[str] = None):
+        """Drop cached volume listings (all of them, or one path for every account)."""
+        if remote_path is None:
+            self._listing_cache.clear()
+        else:
+            for key in [k for k in self._listing_cache if k[1] == remote_path]:
+                del self._listing_cache[key]
     
     # ========================================================================
     # ACCOUNT SWITCHING
@@ -176,7 +413,7 @@ class ModalManager:
         logger.info(f"Switching to account: {username}")
         
         # Get account from database
-        account = account_manager.get_account_by_username(username)
+        account = get_account_manager().get_account_by_username(username)
         if not account:
             return False, f"Account '{username}' not found in database"
         
@@ -185,44 +422,55 @@ class ModalManager:
             return False, f"Account '{username}' has insufficient balance (${account['balance']:.2f})"
         
         # Get current active account
-        current_account = account_manager.get_active_account()
+        current_account = get_account_manager().get_active_account()
+        
+        # Already active in both the database and .modal.toml: nothing to do
+        if current_account and current_account['username'] == username \
+                and await self.get_current_profile() == username:
+            logger.info(f"Account '{username}' is already active")
+            return True, f"Account '{username}' is already active"
         
-        # Stop current ComfyUI if running
+        # Stop current ComfyUI if running. apply_switch marks that account
+        # ready once the switch commits; any earlier exit must do it instead.
+        stopped = None
         if current_account and self.current_deployment:
+            stopped = self.current_deployment.get('username')
             logger.info(f"Stopping ComfyUI on account '{current_account['username']}'")
-            await self.stop_comfyui()
-        
-        # Get decrypted credentials
-        creds = account_manager.get_decrypted_credentials(username)
-        if not creds:
-            return False, f"Failed to decrypt credentials for '{username}'"
-        
-        # Check if profile exists, if not create it
-        profiles = await self.list_profiles()
-        if username not in profiles:
-            logger.info(f"Profile '{username}' doesn't exist, creating it...")
-            success, msg = await self.create_profile(
-                username,
-                creds['token_id'],
-                creds['token_secret']
-            )
-            if not success:
-                return False, f"Failed to create profile: {msg}"
-        else:
-            # Profile exists, just activate it
-            success, msg = await self.activate_profile(username)
-            if not success:
-                return False, f"Failed to activate profile: {msg}"
+            await self.stop_comfyui(mark_ready=False)
         
-        # Update database - set as active account
-        success = account_manager.set_active_account(username)
-        if not success:
-            return False, "Failed to update database"
-        
-        # Update status
-        if current_account:
-            account_manager.update_status(current_account['username'], 'ready')
-        account_manager.update_status(username, 'active')
+        committed = False
+        try:
+            # Get decrypted credentials
+            creds = get_account_manager().get_decrypted_credentials(username)
+            if not creds:
+                return False, f"Failed to decrypt credentials for '{username}'"
+            
+            # Check if profile exists, if not create it
+            profiles = await self.list_profiles()
+            if username not in profiles:
+                logger.info(f"Profile '{username}' doesn't exist, creating it...")
+                success, msg = await self.create_profile(
+                    username,
+                    creds['token_id'],
+                    creds['token_secret']
+                )
+                if not success:
+                    return False, f"Failed to create profile: {msg}"
+            else:
+                # Profile exists, just activate it
+                success, msg = await self.activate_profile(username)
+                if not success:
+                    return False, f"Failed to activate profile: {msg}"
+            
+            # Update database - active flag and both statuses in one transaction
+            previous = current_account['username'] if current_account else username
+            success = get_account_manager().apply_switch(previous, username)
+            if not success:
+                return False, "Failed to update database"
+            committed = True
+        finally:
+            if stopped and not committed:
+                get_account_manager().update_status(stopped, 'ready')
         
         logger.info(f"Successfully switched to account '{username}'")
         return True, f"Switched to account '{username}'"
@@ -237,7 +485,7 @@ class ModalManager:
         logger.info("Finding next available account...")
         
         # Get next available account
-        next_account = account_manager.get_next_available_account()
+        next_account = get_account_manager().get_next_available_account()
         
         if not next_account:
             return False, "No available accounts with sufficient balance", None
@@ -258,7 +506,10 @@ class ModalManager:
         """
         Check credit balance for an account.
         
-        Reads from balance.json in the Modal volume.
+        Reads balance.json from the account's volume through its own SDK
+        client, so it never touches the active profile and is safe to run
+        concurrently.
+        Readings are reused for BALANCE_CACHE_TTL seconds.
         
         Args:
             username: Account username
@@ -266,51 +517,65 @@ class ModalManager:
         Returns:
             Balance amount or None if failed
         """
-        logger.info(f"Checking balance for account '{username}'")
+        # Reuse a recent reading rather than going back to the volume
+        cached = self._balance_cache.get(username)
+        if cached and time.monotonic() - cached[0] < BALANCE_CACHE_TTL:
+            return cached[1]
         
-        # First, make sure this account is active
-        current_profile = await self.get_current_profile()
-        if current_profile != username:
-            logger.info(f"Activating profile '{username}' to check balance")
-            success, msg = await self.activate_profile(username)
-            if not success:
-                logger.error(f"Failed to activate profile for balance check: {msg}")
-                return None
+        logger.info("Checking balance for account '%s'", username)
         
         # Read balance from volume
-        balance = await utils.read_balance_from_volume(config.MODAL_VOLUME_NAME)
+        data = await self.read_volume_file(username, config.MODAL_PATHS['balance_json'])
+        balance = utils.parse_balance_json(data) if data is not None else None
         
         if balance is not None:
+            self._balance_cache[username] = (time.monotonic(), balance)
+            
             # Update database
-            account_manager.update_balance(username, balance)
-            logger.info(f"Balance for '{username}': ${balance:.2f}")
+            get_account_manager().update_balance(username, balance)
+            logger.info("Balance for '%s': $%.2f", username, balance)
             
             # Update status based on balance
+            active = get_account_manager().get_active_account()
             if balance < config.MIN_CREDIT_THRESHOLD:
-                account_manager.update_status(username, 'dead')
-            elif account_manager.get_active_account()['username'] == username:
-                account_manager.update_status(username, 'active')
+                get_account_manager().update_status(username, 'dead')
+            elif active is not None and active['username'] == username:
+                get_account_manager().update_status(username, 'active')
             else:
-                account_manager.update_status(username, 'ready')
+                get_account_manager().update_status(username, 'ready')
         
         return balance
     
     async def check_all_balances(self) -> Dict[str, float]:
         """
-        Check balances for all accounts.
+        Check balances for all accounts, up to BALANCE_CHECK_CONCURRENCY
+        at a time.
         
         Returns:
             Dict mapping username to balance
         """
         logger.info("Checking balances for all accounts")
         
-        balances = {}
-        accounts = account_manager.get_all_accounts()
+        sem = asyncio.Semaphore(BALANCE_CHECK_CONCURRENCY)
+        
+        async def one(username: str):
+            async with sem:
+                return username, await self.check_balance(username)
+        
+        accounts = get_account_manager().get_all_accounts()
+        results = await asyncio.gather(
+            *(one(account['username']) for account in accounts),
+            return_exceptions=True
+        )
         
-        for account in accounts:
-            balance = await self.check_balance(account['username'])
+        balances = {}
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Balance check failed: {result}")
+                continue
+            username, balance = result
             if balance is not None:
-                balances[account['username']] = balance
+                balances[username] = balance
         
         return balances
     
@@ -318,7 +583,8 @@ class ModalManager:
     # COMFYUI DEPLOYMENT
     # ========================================================================
     
-    async def deploy_setup(self, username: str, gpu: str = "T4") -> Tuple[bool, str]:
+    async def deploy_setup(self, username: str, gpu: str = "T4",
+                           on_progress: Optional[Callable[[str], Awaitable[None]]] = None) -> Tuple[bool, str]:
         """
         Run complete setup process (app1.py then app2.py sequentially).
         
@@ -328,6 +594,7 @@ class ModalManager:
         Args:
             username: Account to deploy on
             gpu: GPU to use for setup (default: T4)
+            on_progress: Awaited with each milestone/failure line as it is printed
         
         Returns:
             (success, message)
@@ -340,22 +607,28 @@ class ModalManager:
             return False, f"Failed to switch account: {msg}"
         
         # Update status
-        account_manager.update_status(username, 'building')
+        get_account_manager().update_status(username, 'building')
+        
+        on_line = None
+        if on_progress is not None:
+            async def on_line(line: str):
+                if any(marker in line for marker in SETUP_PROGRESS_MARKERS):
+                    await on_progress(line)
         
         # ===== STEP 1: Run app1.py =====
         logger.info(f"Running setup step 1 (app1.py) for '{username}'")
         app1_path = config.BASE_DIR / 'app1.py'
         
-        # Use friend's pattern: modal run app.py::run
-        command = f"GPU_TYPE={gpu} modal run {app1_path}::run"
+        # Use friend's pattern: modal run app.py::run (GPU passed via env, no shell)
+        argv = config.get_modal_argv('run', file_path=f"{app1_path}::run")
         
-        # 2 hour timeout for step 1
-        return_code, stdout, stderr = await utils.run_command(command, timeout=7200)
+        # 2 hour timeout for step 1 (output streamed, not buffered)
+        return_code, output = await utils.run_command_streaming(argv, timeout=7200, env={'GPU_TYPE': gpu}, on_line=on_line)
         
         if return_code != 0:
-            error_msg = f"Setup step 1 failed: {stderr}"
+            error_msg = f"Setup step 1 failed: {output}"
             logger.error(error_msg)
-            account_manager.update_status(username, 'ready')
+            get_account_manager().update_status(username, 'ready')
             return False, error_msg
         
         logger.info(f"Setup step 1 completed for '{username}'")
@@ -364,22 +637,22 @@ class ModalManager:
         logger.info(f"Running setup step 2 (app2.py) for '{username}'")
         app2_path = config.BASE_DIR / 'app2.py'
         
-        # Use friend's pattern: modal run app.py::run
-        command = f"GPU_TYPE={gpu} modal run {app2_path}::run"
+        # Use friend's pattern: modal run app.py::run (GPU passed via env, no shell)
+        argv = config.get_modal_argv('run', file_path=f"{app2_path}::run")
         
         # 20 minute timeout for step 2
-        return_code, stdout, stderr = await utils.run_command(command, timeout=1200)
+        return_code, output = await utils.run_command_streaming(argv, timeout=1200, env={'GPU_TYPE': gpu}, on_line=on_line)
         
         if return_code != 0:
-            error_msg = f"Setup step 2 failed: {stderr}"
+            error_msg = f"Setup step 2 failed: {output}"
             logger.error(error_msg)
-            account_manager.update_status(username, 'ready')
+            get_account_manager().update_status(username, 'ready')
             return False, error_msg
         
         logger.info(f"Setup completed for '{username}'")
         
         # Update status to ready (not active, since setup doesn't start services)
-        account_manager.update_status(username, 'ready')
+        get_account_manager().update_status(username, 'ready')
         
         return True, "✅ Setup complete! Both steps finished successfully. Use /start to run ComfyUI."
     
@@ -396,35 +669,40 @@ class ModalManager:
         """
         logger.info(f"Starting ComfyUI for '{username}' on GPU: {gpu}")
         
+        # Already running here on this GPU and answering: nothing to start
+        running = self.current_deployment
+        if running and running['username'] == username and gpu in (None, running['gpu']) \
+                and await utils.check_comfyui_ready(running['comfyui_url'], timeout=0.5):
+            logger.info(f"ComfyUI already running for '{username}' on {running['gpu']}")
+            return True, f"ComfyUI already running on {running['gpu']}!"
+        
         # Make sure account is active
         success, msg = await self.switch_to_account(username)
         if not success:
             return False, f"Failed to switch account: {msg}"
         
         # Get account
-        account = account_manager.get_account_by_username(username)
+        account = get_account_manager().get_account_by_username(username)
         
         # Determine GPU to use
         if gpu is None:
-            gpu = account.get('selected_gpu') or 'H100'
+            gpu = account['selected_gpu'] or 'H100'
         
         # Update selected GPU
-        account_manager.update_selected_gpu(username, gpu)
+        get_account_manager().update_selected_gpu(username, gpu)
 
         # Start ComfyUI using app.py with friend's method
         app_path = config.BASE_DIR / 'app.py'
         
         # Use friend's pattern: modal run app.py::run
         # This keeps the process running in background
-        command = f"GPU_TYPE={gpu} modal run {app_path}::run"
+        argv = config.get_modal_argv('run', file_path=f"{app_path}::run")
         
-        # Start in background (no timeout - let it run)
-        asyncio.create_task(utils.run_command(command, timeout=None))
+        # Start in background (no timeout - let it run); kept so stop can cancel it
+        await self._cancel_run_task()
+        self._run_task = asyncio.create_task(utils.run_command(argv, timeout=None, env={'GPU_TYPE': gpu}))
         
-        # Wait a moment for Modal to start
-        await asyncio.sleep(10)
-        
-        # Wait for ComfyUI to become ready (check the URL)
+        # Wait for ComfyUI to become ready (polling starts immediately, with backoff)
         comfyui_url = config.CLOUDFLARE_URLS['comfyui']
         is_ready = await utils.wait_for_comfyui(comfyui_url, max_wait=120)  # 2 min check
         
@@ -440,15 +718,19 @@ class ModalManager:
             'comfyui_url': config.CLOUDFLARE_URLS['comfyui'],
         }
         
-        account_manager.update_status(username, 'active')
+        get_account_manager().update_status(username, 'active')
         
         logger.info(f"ComfyUI started successfully for '{username}' on {gpu}")
         return True, f"ComfyUI started on {gpu}!"
     
-    async def stop_comfyui(self) -> Tuple[bool, str]:
+    async def stop_comfyui(self, mark_ready: bool = True) -> Tuple[bool, str]:
         """
         Stop the currently running ComfyUI app.
         
+        Args:
+            mark_ready: Set the account's status back to 'ready'; callers
+                that write the status themselves pass False
+        
         Returns:
             (success, message)
         """
@@ -457,9 +739,12 @@ class ModalManager:
         
         logger.info("Stopping ComfyUI...")
         
+        # End the local `modal run` first so its pipes close before the app goes
+        await self._cancel_run_task()
+        
         # Stop the Modal app
-        command = config.get_modal_command('app_stop', app_name=config.MODAL_APP_NAME)
-        return_code, stdout, stderr = await utils.run_command(command)
+        argv = config.get_modal_argv('app_stop', app_name=config.MODAL_APP_NAME)
+        return_code, stdout, stderr = await utils.run_command(argv)
         
         if return_code != 0:
             logger.warning(f"Failed to stop app gracefully: {stderr}")
@@ -469,13 +754,23 @@ class ModalManager:
         username = self.current_deployment.get('username')
         self.current_deployment = None
         
+        # The session may have written new outputs
+        self.invalidate_listings(config.MODAL_PATHS['outputs'])
+        
         # Update account status
-        if username:
-            account_manager.update_status(username, 'ready')
+        if username and mark_ready:
+            get_account_manager().update_status(username, 'ready')
         
         logger.info("ComfyUI stopped")
         return True, "ComfyUI stopped successfully"
     
+    async def _cancel_run_task(self):
+        """Cancel the background `modal run` task, if any, and wait for it to exit."""
+        task, self._run_task = self._run_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    
     # ========================================================================
     # VOLUME OPERATIONS
     # ========================================================================
@@ -489,13 +784,13 @@ class ModalManager:
         """
         logger.info("Listing workflows from Modal volume")
         
-        files = await utils.list_modal_volume_files(
-            config.MODAL_VOLUME_NAME,
-            config.MODAL_PATHS['workflows']
-        )
+        active = get_account_manager().get_active_account()
+        if not active:
+            return []
+        files = await self.list_volume_files(active['username'], config.MODAL_PATHS['workflows'])
         
         # Filter for .json files
-        workflows = [f for f in files if f.endswith('.json')]
+        workflows = [f for f in files if f.endswith(config.WORKFLOW_EXTENSIONS)]
         return workflows
     
     async def list_outputs(self) -> list[str]:
@@ -507,47 +802,97 @@ class ModalManager:
         """
         logger.info("Listing outputs from Modal volume")
         
-        files = await utils.list_modal_volume_files(
-            config.MODAL_VOLUME_NAME,
-            config.MODAL_PATHS['outputs']
-        )
+        active = get_account_manager().get_active_account()
+        if not active:
+            return []
+        files = await self.list_volume_files(active['username'], config.MODAL_PATHS['outputs'])
         
         # Filter for valid output extensions
-        outputs = [f for f in files if utils.is_valid_output_file(f)]
+        exts = config.ALLOWED_OUTPUT_EXTENSIONS
+        outputs = [f for f in files if f.lower().endswith(exts)]
         return outputs
     
     async def get_workflow(self, workflow_name: str) -> Optional[Dict[Any, Any]]:
         """
         Download and read a workflow JSON file.
         
+        Downloads are kept in WORKFLOW_CACHE_DIR as "<name>@<size>-<mtime>.json",
+        so an unchanged workflow is read from disk and an edited one misses
+        the cache.
+        
         Args:
             workflow_name: Workflow filename (e.g., "seedream.json")
         
         Returns:
             Workflow dict or None if failed
         """
-        logger.info(f"Downloading workflow: {workflow_name}")
-        
         # Ensure .json extension
         if not workflow_name.endswith('.json'):
             workflow_name += '.json'
         
-        # Download to temp
-        temp_file = config.TEMP_DIR / workflow_name
+        active = get_account_manager().get_active_account()
+        if not active:
+            logger.error(f"No active account to read workflow {workflow_name} from")
+            return None
+        username = active['username']
         remote_path = f"{config.MODAL_PATHS['workflows']}/{workflow_name}"
         
-        success = await utils.download_from_modal_volume(
-            config.MODAL_VOLUME_NAME,
-            remote_path,
-            temp_file
-        )
+        stat = await self.stat_volume_file(username, remote_path)
+        if stat is None:
+            logger.error(f"Workflow not found: {workflow_name}")
+            return None
         
-        if not success:
+        size, mtime = stat
+        stem = workflow_name[:-5]
+        cache_file = WORKFLOW_CACHE_DIR / f"{stem}@{size}-{int(mtime)}.json"
+        
+        cached = await asyncio.to_thread(self._read_cached_workflow, cache_file)
+        if cached is not None:
+            return cached
+        
+        logger.info(f"Downloading workflow: {workflow_name}")
+        data = await self.read_volume_file(username, remote_path)
+        if data is None:
             logger.error(f"Failed to download workflow: {workflow_name}")
             return None
         
-        # Read JSON
-        return utils.read_json_file(temp_file)
+        await asyncio.to_thread(self._store_cached_workflow, stem, cache_file, data)
+        
+        try:
+            return utils.loads_json(data)
+        except ValueError as e:
+            logger.error(f"Invalid workflow JSON in {workflow_name}: {e}")
+            return None
+    
+    def _read_cached_workflow(self, cache_file: Path) -> Optional[Dict[Any, Any]]:
+        """Read a cached workflow and mark it recently used; None on a miss."""
+        try:
+            os.utime(cache_file)  # Mark as recently used for eviction
+        except FileNotFoundError:
+            return None
+        return utils.read_json_file(cache_file)
+    
+    def _store_cached_workflow(self, stem: str, cache_file: Path, data: bytes):
+        """Replace any older cached copy of a workflow, then trim the cache."""
+        utils.ensure_directory(WORKFLOW_CACHE_DIR)
+        own_copy = re.compile(re.escape(stem) + r'@\d+-\d+\.json')
+        for stale in WORKFLOW_CACHE_DIR.glob(f"{glob.escape(stem)}@*.json"):
+            if own_copy.fullmatch(stale.name):
+                stale.unlink(missing_ok=True)
+        tmp_file = cache_file.with_suffix('.tmp')
+        tmp_file.write_bytes(data)
+        os.replace(tmp_file, cache_file)
+        self._evict_workflow_cache()
+    
+    def _evict_workflow_cache(self):
+        """Delete least recently used cached workflows beyond WORKFLOW_CACHE_MAX_BYTES."""
+        files = [(f.stat(), f) for f in WORKFLOW_CACHE_DIR.glob('*.json')]
+        total = sum(st.st_size for st, _ in files)
+        for st, f in sorted(files, key=lambda item: item[0].st_mtime):
+            if total <= WORKFLOW_CACHE_MAX_BYTES:
+                break
+            f.unlink(missing_ok=True)
+            total -= st.st_size
     
     async def get_output_file(self, filename: str) -> Optional[Path]:
         """
@@ -561,15 +906,16 @@ class ModalManager:
         """
         logger.info(f"Downloading output: {filename}")
         
+        active = get_account_manager().get_active_account()
+        if not active:
+            logger.error(f"No active account to download output {filename} from")
+            return None
+        
         # Download to temp
         temp_file = config.TEMP_DIR / filename
         remote_path = f"{config.MODAL_PATHS['outputs']}/{filename}"
         
-        success = await utils.download_from_modal_volume(
-            config.MODAL_VOLUME_NAME,
-            remote_path,
-            temp_file
-        )
+        success = await self.download_volume_file(active['username'], remote_path, temp_file)
         
         if not success:
             logger.error(f"Failed to download output: {filename}")
@@ -60,6 +60,7 @@ ICONS = {
     'warning': '⚠️',          # Warning
     'error': '❌',            # Error
     'clock': '⏱️',            # Timer
+    'info': 'ℹ️',             # Information
     
     # GPU Icons
     'gpu': '🖥️',             # GPU selector
@@ -337,21 +338,18 @@ CHANNEL_CONFIG = {
 # HELPER FUNCTIONS (DO NOT EDIT UNLESS YOU KNOW WHAT YOU'RE DOING)
 # ============================================================================
 
+import bisect
+
+# Battery levels in ascending order; a percentage at or above the Nth
+# threshold shows the icon after it
+_BATTERY_LEVELS = ('low', 'medium', 'high', 'full')
+_BATTERY_THRESHOLDS = tuple(CREDIT_CONFIG['battery_thresholds'][level] for level in _BATTERY_LEVELS)
+_BATTERY_ICONS = (BATTERY_ICONS['critical'],) + tuple(BATTERY_ICONS[level] for level in _BATTERY_LEVELS)
+
 def get_battery_icon(balance, max_balance=80.0):
     """Get battery icon based on credit balance."""
     percentage = (balance / max_balance) * 100
-    
-    thresholds = CREDIT_CONFIG['battery_thresholds']
-    if percentage >= thresholds['full']:
-        return BATTERY_ICONS['full']
-    elif percentage >= thresholds['high']:
-        return BATTERY_ICONS['high']
-    elif percentage >= thresholds['medium']:
-        return BATTERY_ICONS['medium']
-    elif percentage >= thresholds['low']:
-        return BATTERY_ICONS['low']
-    else:
-        return BATTERY_ICONS['critical']
+    return _BATTERY_ICONS[bisect.bisect_right(_BATTERY_THRESHOLDS, percentage)]
 
 def format_currency(amount):
     """Format currency with symbol and decimal places."""
@@ -359,15 +357,20 @@ def format_currency(amount):
     places = CREDIT_CONFIG['decimal_places']
     return f"{symbol}{amount:.{places}f}"
 
+# Every bar create_progress_bar can draw, indexed by filled length
+_PROGRESS_BARS = [
+    PROGRESS_BAR['filled_char'] * i + PROGRESS_BAR['empty_char'] * (PROGRESS_BAR['length'] - i)
+    for i in range(PROGRESS_BAR['length'] + 1)
+]
+
 def create_progress_bar(current, total):
     """Create a visual progress bar."""
-    config = PROGRESS_BAR
-    percentage = int((current / total) * 100)
-    filled = int((current / total) * config['length'])
-    bar = config['filled_char'] * filled + config['empty_char'] * (config['length'] - filled)
+    length = PROGRESS_BAR['length']
+    percentage = int(current * 100 // total)
+    bar = _PROGRESS_BARS[max(0, min(int(current * length // total), length))]
     
-    if config['show_percentage']:
-        return config['style'].format(bar=bar, percent=percentage)
+    if PROGRESS_BAR['show_percentage']:
+        return PROGRESS_BAR['style'].format(bar=bar, percent=percentage)
     return f"[{bar}]"
 
 def get_status_color(status):
@@ -6,44 +6,74 @@ Contains encryption, file operations, HTTP requests, and more.
 """
 
 import os
+import re
 import json
+import shlex
 import asyncio
 import subprocess
 import logging
+from collections import deque
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, Awaitable
 import aiohttp
 from cryptography.fernet import Fernet
 import config
 
+try:
+    import orjson
+except ImportError:  # Optional C parser, fall back to the stdlib
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 # ============================================================================
 # ENCRYPTION UTILITIES
 # ============================================================================
 
+# Tokens are encrypted with Fernet from the `cryptography` package, which runs
+# AES-128-CBC and HMAC-SHA256 through OpenSSL and so uses AES-NI where the CPU
+# has it. There is no pure-Python crypto path to replace.
+
+# The key file never changes while the bot runs, so the key and the Fernet
+# built from it are loaded once; call _reset_fernet() after rotating the key.
+_KEY_CACHE: Optional[bytes] = None
+_FERNET: Optional[Fernet] = None
+
 def get_encryption_key() -> bytes:
     """Get or create encryption key for storing Modal tokens."""
+    global _KEY_CACHE
+    if _KEY_CACHE is not None:
+        return _KEY_CACHE
+    
     if config.ENCRYPTION_KEY_FILE.exists():
-        return config.ENCRYPTION_KEY_FILE.read_bytes()
+        _KEY_CACHE = config.ENCRYPTION_KEY_FILE.read_bytes()
     else:
-        key = Fernet.generate_key()
-        config.ENCRYPTION_KEY_FILE.write_bytes(key)
+        _KEY_CACHE = Fernet.generate_key()
+        config.ENCRYPTION_KEY_FILE.write_bytes(_KEY_CACHE)
         logger.info(f"Generated new encryption key: {config.ENCRYPTION_KEY_FILE}")
-        return key
+    return _KEY_CACHE
+
+def _get_fernet() -> Fernet:
+    """Get the shared Fernet instance, creating it on first use."""
+    global _FERNET
+    if _FERNET is None:
+        _FERNET = Fernet(get_encryption_key())
+    return _FERNET
+
+def _reset_fernet():
+    """Forget the cached key and Fernet so the key file is read again."""
+    global _KEY_CACHE, _FERNET
+    _KEY_CACHE = None
+    _FERNET = None
 
 def encrypt_data(data: str) -> str:
     """Encrypt sensitive data (like Modal tokens)."""
-    key = get_encryption_key()
-    f = Fernet(key)
-    encrypted = f.encrypt(data.encode())
+    encrypted = _get_fernet().encrypt(data.encode())
     return encrypted.decode()
 
 def decrypt_data(encrypted_data: str) -> str:
     """Decrypt sensitive data."""
-    key = get_encryption_key()
-    f = Fernet(key)
-    decrypted = f.decrypt(encrypted_data.encode())
+    decrypted = _get_fernet().decrypt(encrypted_data.encode())
     return decrypted.decode()
 
 # ============================================================================
@@ -55,29 +85,47 @@ def ensure_directory(path: Path) -> Path:
     path.mkdir(parents=True, exist_ok=True)
     return path
 
+# Invalid filename characters, each mapped to '_'
+_FILENAME_TRANSLATE = str.maketrans({char: '_' for char in '<>:"/\\|?*'})
+
 def clean_filename(filename: str) -> str:
     """Clean filename for safe file operations."""
-    # Remove invalid characters
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
-    return filename
+    # Replace invalid characters in a single pass
+    return filename.translate(_FILENAME_TRANSLATE)
 
 def get_file_size_mb(filepath: Path) -> float:
-    """Get file size in megabytes."""
-    if not filepath.exists():
+    """Get file size in megabytes (0.0 if the file is missing)."""
+    try:
+        return filepath.stat().st_size / 1048576  # 1024 * 1024
+    except OSError:
         return 0.0
-    return filepath.stat().st_size / (1024 * 1024)
 
 def is_valid_output_file(filename: str) -> bool:
     """Check if filename has a valid output extension."""
-    ext = Path(filename).suffix.lower()
-    return ext in config.ALLOWED_OUTPUT_EXTENSIONS
+    return filename.lower().endswith(config.ALLOWED_OUTPUT_EXTENSIONS)
 
 # ============================================================================
 # JSON OPERATIONS
 # ============================================================================
 
+def loads_json(data: bytes) -> Any:
+    """
+    Parse JSON from raw bytes, with orjson when it is installed.
+    
+    Raises:
+        ValueError: If the data is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_json(data: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
 def read_json_file(filepath: Path) -> Optional[Dict[Any, Any]]:
     """Read and parse JSON file."""
     try:
@@ -85,9 +133,8 @@ def read_json_file(filepath: Path) -> Optional[Dict[Any, Any]]:
             logger.warning(f"JSON file not found: {filepath}")
             return None
         
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError as e:
+        return loads_json(filepath.read_bytes())
+    except ValueError as e:
         logger.error(f"Failed to parse JSON file {filepath}: {e}")
         return None
     except Exception as e:
@@ -98,8 +145,7 @@ def write_json_file(filepath: Path, data: Dict[Any, Any]) -> bool:
     """Write data to JSON file."""
     try:
         ensure_directory(filepath.parent)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        filepath.write_bytes(dumps_json(data, indent=True))
         return True
     except Exception as e:
         logger.error(f"Error writing JSON file {filepath}: {e}")
@@ -109,20 +155,28 @@ def write_json_file(filepath: Path, data: Dict[Any, Any]) -> bool:
 # SUBPROCESS UTILITIES (for Modal CLI commands)
 # ============================================================================
 
-async def run_command(command: str, timeout: int = 300) -> tuple[int, str, str]:
+async def run_command(argv: List[str], timeout: int = 300,
+                      env: Optional[Dict[str, str]] = None) -> tuple[int, str, str]:
     """
-    Run a shell command asynchronously.
+    Run a command from an argv list, without a shell.
+    
+    Args:
+        argv: Program and arguments; nothing is re-split or shell-expanded
+        timeout: Seconds before the process is killed (None for no limit)
+        env: Extra environment variables layered over os.environ
     
     Returns:
         (return_code, stdout, stderr)
     """
+    command = shlex.join(argv)
     try:
         logger.info(f"Running command: {command}")
         
-        process = await asyncio.create_subprocess_shell(
-            command,
+        process = await asyncio.create_subprocess_exec(
+            *argv,
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+            stderr=asyncio.subprocess.PIPE,
+            env={**os.environ, **env} if env else None
         )
         
         try:
@@ -132,8 +186,15 @@ async def run_command(command: str, timeout: int = 300) -> tuple[int, str, str]:
             )
         except asyncio.TimeoutError:
             process.kill()
+            await process.wait()
             logger.error(f"Command timed out after {timeout}s: {command}")
             return -1, "", "Command timed out"
+        except asyncio.CancelledError:
+            # Don't leave the child (and its pipes) behind a cancelled task
+            process.kill()
+            await process.wait()
+            logger.info(f"Command cancelled: {command}")
+            raise
         
         return_code = process.returncode
         stdout_str = stdout.decode('utf-8', errors='ignore').strip()
@@ -150,19 +211,128 @@ async def run_command(command: str, timeout: int = 300) -> tuple[int, str, str]:
         logger.error(f"Error running command '{command}': {e}")
         return -1, "", str(e)
 
-def run_command_sync(command: str, timeout: int = 300) -> tuple[int, str, str]:
+# Long-running commands keep only this many trailing output lines in memory
+STREAM_TAIL_LINES = 20
+# Longest output line kept; progress bars can make very long lines
+STREAM_LINE_LIMIT = 1024 * 1024
+# Lines waiting for on_line; beyond this they are dropped, not waited on
+STREAM_HANDLER_QUEUE = 100
+
+async def run_command_streaming(argv: List[str], timeout: int = 300,
+                                env: Optional[Dict[str, str]] = None,
+                                on_line: Optional[Callable[[str], Awaitable[None]]] = None) -> tuple[int, str]:
     """
-    Run a shell command synchronously (blocking).
+    Run a long command (argv list, no shell), reading its output line by line.
+    
+    Output is not buffered: stderr is merged into stdout, WARN/ERROR lines
+    are logged as they arrive, and only the last STREAM_TAIL_LINES lines are
+    kept for the caller's error message. If on_line is given it is awaited
+    with each decoded line from a separate task, fed through a queue of
+    STREAM_HANDLER_QUEUE lines, so a slow handler drops lines instead of
+    stalling the pipe. A line longer than STREAM_LINE_LIMIT is discarded
+    rather than aborting the read.
+    
+    The child is killed and reaped on any exit other than its own,
+    including timeout, error and cancellation.
+    
+    Returns:
+        (return_code, tail_of_output)
+    """
+    tail = deque(maxlen=STREAM_TAIL_LINES)
+    command = shlex.join(argv)
+    try:
+        logger.info(f"Running command (streaming): {command}")
+        
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env={**os.environ, **env} if env else None,
+            limit=STREAM_LINE_LIMIT
+        )
+    except Exception as e:
+        logger.error(f"Error running command '{command}': {e}")
+        return -1, str(e)
+    
+    lines: asyncio.Queue = asyncio.Queue(maxsize=STREAM_HANDLER_QUEUE)
+    
+    async def deliver():
+        while (line := await lines.get()) is not None:
+            try:
+                await on_line(line)
+            except Exception as e:
+                logger.error(f"Output handler failed: {e}")
+    
+    async def drain():
+        skipping = False  # Inside an oversize line, dropping up to its newline
+        while True:
+            try:
+                raw = await process.stdout.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                raw = e.partial  # EOF; keep a final unterminated line
+                if not raw:
+                    break
+            except asyncio.LimitOverrunError as e:
+                await process.stdout.readexactly(e.consumed)
+                skipping = True
+                continue
+            if skipping:
+                skipping = False
+                continue
+            if b'ERROR' in raw or b'WARN' in raw:
+                logger.warning(raw.decode('utf-8', errors='ignore').rstrip())
+            tail.append(raw)
+            if on_line is not None:
+                try:
+                    lines.put_nowait(raw.decode('utf-8', errors='ignore').rstrip())
+                except asyncio.QueueFull:
+                    pass  # Handler is behind; never block the reader on it
+        return await process.wait()
+    
+    deliverer = asyncio.create_task(deliver()) if on_line is not None else None
+    try:
+        return_code = await asyncio.wait_for(drain(), timeout=timeout)
+        if deliverer is not None:
+            await lines.put(None)  # Let the handler finish what is queued
+            await deliverer
+    except asyncio.TimeoutError:
+        logger.error(f"Command timed out after {timeout}s: {command}")
+        return -1, "Command timed out"
+    except asyncio.CancelledError:
+        logger.info(f"Command cancelled: {command}")
+        raise
+    except Exception as e:
+        logger.error(f"Error running command '{command}': {e}")
+        return -1, str(e)
+    finally:
+        # Don't leave the child running behind an undrained pipe
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        if deliverer is not None:
+            deliverer.cancel()
+    
+    output = b''.join(tail).decode('utf-8', errors='ignore').strip()
+    if return_code == 0:
+        logger.info(f"Command successful: {command}")
+    else:
+        logger.error(f"Command failed (code {return_code}): {command}\nOutput: {output}")
+    
+    return return_code, output
+
+def run_command_sync(argv: List[str], timeout: int = 300) -> tuple[int, str, str]:
+    """
+    Run a command from an argv list synchronously (blocking), without a shell.
     
     Returns:
         (return_code, stdout, stderr)
     """
+    command = shlex.join(argv)
     try:
         logger.info(f"Running command (sync): {command}")
         
         result = subprocess.run(
-            command,
-            shell=True,
+            argv,
             capture_output=True,
             text=True,
             timeout=timeout
@@ -186,6 +356,26 @@ def run_command_sync(command: str, timeout: int = 300) -> tuple[int, str, str]:
 # HTTP REQUEST UTILITIES
 # ============================================================================
 
+# One pooled session for the whole bot: keep-alive connections and cached DNS
+_session: Optional[aiohttp.ClientSession] = None
+
+async def get_session() -> aiohttp.ClientSession:
+    """Get the shared aiohttp session, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=config.REQUEST_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300, keepalive_timeout=30)
+        )
+    return _session
+
+async def close_session():
+    """Close the shared aiohttp session (called on bot shutdown)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
 async def fetch_url(url: str, timeout: int = None) -> Optional[Dict[Any, Any]]:
     """
     Fetch JSON data from URL.
@@ -197,13 +387,13 @@ async def fetch_url(url: str, timeout: int = None) -> Optional[Dict[Any, Any]]:
         timeout = config.REQUEST_TIMEOUT
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=timeout) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.warning(f"HTTP {response.status} from {url}")
-                    return None
+        session = await get_session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status == 200:
+                return loads_json(await response.read())
+            else:
+                logger.warning(f"HTTP {response.status} from {url}")
+                return None
     except asyncio.TimeoutError:
         logger.error(f"Request timeout for {url}")
         return None
@@ -222,15 +412,16 @@ async def post_json(url: str, data: Dict[Any, Any], timeout: int = None) -> Opti
         timeout = config.REQUEST_TIMEOUT
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, timeout=timeout) as response:
-                if response.status in [200, 201]:
-                    return await response.json()
-                else:
-                    logger.warning(f"HTTP {response.status} from {url}")
-                    text = await response.text()
-                    logger.debug(f"Response: {text}")
-                    return None
+        session = await get_session()
+        async with session.post(url, data=dumps_json(data), headers={'Content-Type': 'application/json'},
+                                timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status in [200, 201]:
+                return loads_json(await response.read())
+            else:
+                logger.warning(f"HTTP {response.status} from {url}")
+                text = await response.text()
+                logger.debug(f"Response: {text}")
+                return None
     except asyncio.TimeoutError:
         logger.error(f"Request timeout for {url}")
         return None
@@ -241,35 +432,57 @@ async def post_json(url: str, data: Dict[Any, Any], timeout: int = None) -> Opti
 async def check_url_reachable(url: str, timeout: int = 10) -> bool:
     """Check if a URL is reachable."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=timeout) as response:
-                return response.status == 200
+        session = await get_session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            return response.status == 200
     except:
         return False
 
+async def _poll_with_backoff(check: Callable[[], Awaitable[bool]], max_wait: float,
+                             max_delay: float) -> bool:
+    """
+    Await check() until it returns True or max_wait seconds pass.
+    
+    The pause between checks starts at 100ms and doubles up to max_delay,
+    so early readiness is seen quickly and a slow start isn't hammered.
+    
+    Returns:
+        True if check() succeeded, False if timed out
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait
+    delay = 0.1
+    
+    while True:
+        if await check():
+            return True
+        
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
 async def wait_for_url(url: str, max_wait: int = 300, check_interval: int = 5) -> bool:
     """
     Wait for a URL to become reachable.
     
+    Polls with exponential backoff, capped at check_interval.
+    
     Args:
         url: URL to check
         max_wait: Maximum time to wait in seconds
-        check_interval: How often to check in seconds
+        check_interval: Longest pause between checks (and per-check timeout) in seconds
     
     Returns:
         True if URL became reachable, False if timed out
     """
     logger.info(f"Waiting for {url} to become reachable...")
-    elapsed = 0
-    
-    while elapsed < max_wait:
-        if await check_url_reachable(url, timeout=check_interval):
-            logger.info(f"{url} is now reachable!")
-            return True
-        
-        await asyncio.sleep(check_interval)
-        elapsed += check_interval
-        logger.debug(f"Still waiting for {url}... ({elapsed}/{max_wait}s)")
+    if await _poll_with_backoff(lambda: check_url_reachable(url, timeout=check_interval),
+                                max_wait, max_delay=check_interval):
+        logger.info(f"{url} is now reachable!")
+        return True
     
     logger.error(f"Timeout waiting for {url} after {max_wait}s")
     return False
@@ -278,23 +491,41 @@ async def wait_for_url(url: str, max_wait: int = 300, check_interval: int = 5) -
 # COMFYUI SPECIFIC UTILITIES
 # ============================================================================
 
-async def check_comfyui_ready(base_url: str) -> bool:
-    """Check if ComfyUI is ready by hitting the system_stats endpoint."""
+async def check_comfyui_ready(base_url: str, timeout: float = 3) -> bool:
+    """
+    Check if ComfyUI is ready by hitting the system_stats endpoint.
+    
+    Sends a HEAD over the shared session. A 2xx/3xx means the server is
+    up, as does 405 from a server that only routes GET. Other 4xx/5xx
+    answers (e.g. the tunnel's 404 or 502 while the origin is down) don't.
+    """
     url = base_url.rstrip('/') + config.COMFYUI_API['system_stats']
-    return await check_url_reachable(url)
+    try:
+        session = await get_session()
+        async with session.head(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            return 200 <= response.status < 400 or response.status == 405
+    except Exception:
+        return False
 
 async def wait_for_comfyui(base_url: str, max_wait: int = None) -> bool:
     """
     Wait for ComfyUI to become ready.
     
+    Polls with exponential backoff, capped at 2s.
+    
     Returns:
         True if ComfyUI is ready, False if timed out
     """
     if max_wait is None:
         max_wait = config.COMFYUI_STARTUP_TIMEOUT
     
-    url = base_url.rstrip('/') + config.COMFYUI_API['system_stats']
-    return await wait_for_url(url, max_wait, config.COMFYUI_CHECK_INTERVAL)
+    logger.info(f"Waiting for ComfyUI at {base_url} to become ready...")
+    if await _poll_with_backoff(lambda: check_comfyui_ready(base_url), max_wait, max_delay=2.0):
+        logger.info("ComfyUI is ready!")
+        return True
+    
+    logger.error(f"Timeout waiting for ComfyUI after {max_wait}s")
+    return False
 
 async def send_comfyui_prompt(base_url: str, workflow: Dict[Any, Any], prompt: str) -> Optional[Dict[Any, Any]]:
     """
@@ -321,81 +552,20 @@ async def send_comfyui_prompt(base_url: str, workflow: Dict[Any, Any], prompt: s
     return await post_json(url, payload)
 
 # ============================================================================
-# MODAL VOLUME UTILITIES
+# BALANCE.JSON PARSING
 # ============================================================================
 
-async def list_modal_volume_files(volume_name: str, path: str) -> List[str]:
-    """
-    List files in a Modal volume path.
-    
-    Returns:
-        List of filenames
-    """
-    command = config.get_modal_command(
-        'volume_ls',
-        volume_name=volume_name,
-        path=path
-    )
-    
-    return_code, stdout, stderr = await run_command(command)
-    
-    if return_code != 0:
-        logger.error(f"Failed to list volume files: {stderr}")
-        return []
-    
-    # Parse output (format depends on Modal CLI output)
-    files = [line.strip() for line in stdout.split('\n') if line.strip()]
-    return files
-
-async def download_from_modal_volume(volume_name: str, remote_path: str, local_path: Path) -> bool:
-    """
-    Download a file from Modal volume.
-    
-    Returns:
-        True if successful, False otherwise
-    """
-    ensure_directory(local_path.parent)
-    
-    command = config.get_modal_command(
-        'volume_get',
-        volume_name=volume_name,
-        remote_path=remote_path,
-        local_path=str(local_path)
-    )
-    
-    return_code, stdout, stderr = await run_command(command)
-    
-    if return_code != 0:
-        logger.error(f"Failed to download from volume: {stderr}")
-        return False
-    
-    return local_path.exists()
-
-async def read_balance_from_volume(volume_name: str) -> Optional[float]:
-    """
-    Read credit balance from balance.json in Modal volume.
-    
-    Returns:
-        Balance amount or None if failed
-    """
-    # Download balance.json to temp location
-    temp_balance_file = config.TEMP_DIR / "balance.json"
-    
-    success = await download_from_modal_volume(
-        volume_name=volume_name,
-        remote_path=config.MODAL_PATHS['balance_json'],
-        local_path=temp_balance_file
-    )
-    
-    if not success:
-        logger.error("Failed to download balance.json")
-        return None
-    
-    # Read balance from JSON
-    data = read_json_file(temp_balance_file)
-    if not data:
+def parse_balance_json(raw: bytes) -> Optional[float]:
+    """Parse raw balance.json contents. Returns the balance or None."""
+    try:
+        data = loads_json(raw)
+    except ValueError as e:
+        logger.error(f"Invalid balance.json: {e}")
         return None
-    
+    return extract_balance(data) if data else None
+
+def extract_balance(data: Dict[str, Any]) -> Optional[float]:
+    """Pull the balance out of a parsed balance.json dict."""
     # Extract balance (adjust key name based on your JSON structure)
     balance = data.get('balance') or data.get('credits') or data.get('amount')
     
@@ -461,6 +631,9 @@ def validate_modal_token(token_id: str, token_secret: str) -> tuple[bool, str]:
     
     return True, ""
 
+# Letters, digits, underscore and hyphen, with at least one letter or digit
+_USERNAME_RE = re.compile(r'[\w-]*[^\W_][\w-]*')
+
 def validate_username(username: str) -> tuple[bool, str]:
     """
     Validate username format.
@@ -478,7 +651,7 @@ def validate_username(username: str) -> tuple[bool, str]:
         return False, "Username must be less than 50 characters"
     
     # Check for valid characters (alphanumeric, underscore, hyphen)
-    if not username.replace('_', '').replace('-', '').isalnum():
+    if not _USERNAME_RE.fullmatch(username):
         return False, "Username can only contain letters, numbers, underscore, and hyphen"
     
     return True, ""
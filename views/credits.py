@@ -16,7 +16,7 @@ async def get_credits_from_tracker():
         float: Credit balance, or None if not available
     """
     try:
-        from .. import config
+        from .. import config, utils
         
         # Check if ComfyUI is running
         from ..modal_manager import modal_manager
@@ -30,17 +30,17 @@ async def get_credits_from_tracker():
         # https://comfyui.tensorart.site/custom_nodes/ComfyUI-CreditTracker/balance.json
         balance_url = f"{comfyui_url.rstrip('/')}/custom_nodes/ComfyUI-CreditTracker/balance.json"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(balance_url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # The balance.json structure should be: {"balance": 12.34}
-                    # Adjust this based on actual structure
-                    balance = data.get('balance', None)
-                    
-                    if balance is not None:
-                        return float(balance)
+        session = await utils.get_session()
+        async with session.get(balance_url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+            if response.status == 200:
+                data = utils.loads_json(await response.read())
+                
+                # The balance.json structure should be: {"balance": 12.34}
+                # Adjust this based on actual structure
+                balance = data.get('balance', None)
+                
+                if balance is not None:
+                    return float(balance)
         
         return None
         
@@ -36,7 +36,7 @@ class MainControlPanel(View):
                 return
             
             username = active_account['username']
-            gpu = active_account.get('selected_gpu', 'H100')
+            gpu = active_account['selected_gpu'] or 'H100'
             
             # Check if already running
             if modal_manager.current_deployment:
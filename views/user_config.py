@@ -118,8 +118,8 @@ class SwitchAccountView(View):
         options = []
         for account in accounts:
             username = account['username']
-            credits = account.get('credits', 0)
-            status = account.get('status', 'unknown')
+            credits = account['balance']
+            status = account['status']
             
             # Emoji based on status
             emoji = "✅" if username == current_username else "⚪"